@@ -14,9 +14,14 @@ were provided for by REFMAP(http://www.tekepon.net/fsm)
 """
 
 from objects import *
-import random
 from math import *
 
+# NumPy is only needed for the array backend, so don't insist on it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 def bound(x, a, b):
     if x < a: return a
     if x > b: return b
@@ -37,12 +42,15 @@ class Agent(object):
         "agent_move_speed"
     ]
     
-    def __init__(self, config, parent1=None, parent2=None):
+    def __init__(self, config, random_streams, parent1=None, parent2=None):
         """ Create a new Agent.
 
+        random_streams - the World's RandomStreams; the agent's random choices
+                         come from its "genetics" and "behaviour" streams
         parent1, parent2 - the Agents of the two parents, or
                            None if this agent belongs to one of the initial critters. """
         self.config = config
+        self.random = random_streams.stream("behaviour")
         self.clock = 0
         self.avoidance_countdown = 0
 
@@ -59,10 +67,12 @@ class Agent(object):
         # settings and adding some randomness (that's how genetics
         # works, right?)
         else:
+            genetics_random = random_streams.stream("genetics")
             for t in Agent.trait_names:
+                (low, high) = config.trait_bounds[t]
                 value = (parent1.traits[t] + parent2.traits[t])/2
-                value += (2*random.random() - 1)*config.agent_trait_variance*config[t]
-                value = bound(value, config[t + "_min"], config[t + "_max"])
+                value += (2*genetics_random.random() - 1)*config.agent_trait_variance*config[t]
+                value = bound(value, low, high)
                 self.traits[t] = value
         
     def compute_next_action(self, critter, visible_objects):
@@ -137,6 +147,99 @@ class Agent(object):
         else:
             # Can't see any food; walk around randomly
             turn_angle = 0
-            if random.randint(0, int(self.config.framerate*self.traits["mean_turn_interval"])) == 5:
-                turn_angle = (random.randint(0, 4)*pi)/2
+            # int(random()*(n + 1)) is distributed like randint(0, n), but is
+            # much cheaper to draw
+            highest = int(self.config.framerate*self.traits["mean_turn_interval"])
+            if int(self.random.random()*(highest + 1)) == 5:
+                turn_angle = (int(self.random.random()*5)*pi)/2
             return (turn_angle, self.traits["agent_move_speed"], reproduction_target)
+
+
+def compute_next_actions(config, state):
+    """ Batched version of Agent.compute_next_action, which decides what every
+    critter in a CritterArrays (state) will do in one go, using the neighbours
+    found by state.perceive. Follows the same heuristics as Agent.compute_next_action,
+    which remains the reference implementation; the agents' clocks and avoidance
+    countdowns are the agent_clock and avoidance_countdown arrays of state.
+
+    Returns a tuple of arrays (turn_angle, move_distance, reproduction_target),
+    with one entry per critter row; reproduction_target gives the index in
+    state.targets of the critter to reproduce with, or -1 for none. """
+    count = state.count
+    (offsets, indices, dx, dy) = state.neighbours
+    codes = state.type_codes
+    trait_columns = dict((t, i) for (i, t) in enumerate(state.trait_names))
+    traits = state.traits[:count]
+
+    direction = state.direction[:count]
+    male = state.male[:count]
+    mature = state.age[:count] >= config.maturity_age
+    clock = state.agent_clock[:count]
+    avoidance_countdown = state.avoidance_countdown[:count]
+
+    turn_angle = numpy.zeros(count)
+    move_distance = traits[:, trait_columns["agent_move_speed"]].copy()
+    reproduction_target = -numpy.ones(count, dtype=numpy.int64)
+
+    # Describe every (critter, visible object) pair
+    pair_critters = numpy.repeat(numpy.arange(count), numpy.diff(offsets))
+    pair_types = state.target_types[indices]
+    pair_distance_sq = dx*dx + dy*dy
+
+    clock += 1
+
+    # Think about reproduction; the target is the first suitable critter
+    # in each critter's list of visible objects
+    wants_to_reproduce = mature \
+        & (state.energy[:count] > traits[:, trait_columns["reproduction_energy_threshold"]]) \
+        & (clock > traits[:, trait_columns["reproduction_period"]])
+    pairs = numpy.flatnonzero(wants_to_reproduce[pair_critters]
+                              & (pair_types == codes["Critter"])
+                              & (pair_distance_sq <= config.reproduction_radius_sq))
+    # Visible critters have target index == row, so we can look them up directly
+    pairs = pairs[(male[indices[pairs]] != male[pair_critters[pairs]])
+                  & mature[indices[pairs]]]
+    (critters, pairs) = first_pair_per_critter(pair_critters, pairs)
+    reproduction_target[critters] = indices[pairs]
+    clock[critters] = 0
+
+    # Critters which are currently avoiding something just keep walking
+    deciding = avoidance_countdown <= 0
+    avoidance_countdown[~deciding] -= 1
+
+    # object avoidance
+    pairs = numpy.flatnonzero(deciding[pair_critters]
+        & (((pair_types == codes["Critter"])
+                & (pair_distance_sq <= config.critter_avoidance_radius**2))
+           | ((pair_types == codes["Scenery"])
+                & (pair_distance_sq <= config.scenery_avoidance_radius**2))))
+    (critters, pairs) = first_pair_per_critter(pair_critters, pairs)
+    turn_angle[critters] = numpy.arctan2(-dy[pairs], -dx[pairs]) - direction[critters]
+    avoidance_countdown[critters] = config.avoidance_time*config.framerate
+    deciding[critters] = False
+
+    # Look for food, and move towards the closest; sort each critter's
+    # visible food by distance, keeping the original order for ties
+    pairs = numpy.flatnonzero(deciding[pair_critters] & (pair_types == codes["Food"]))
+    pairs = pairs[numpy.lexsort((pair_distance_sq[pairs], pair_critters[pairs]))]
+    (critters, pairs) = first_pair_per_critter(pair_critters, pairs)
+    turn_angle[critters] = numpy.arctan2(dy[pairs], dx[pairs]) - direction[critters]
+    deciding[critters] = False
+
+    # Can't see any food; walk around randomly. Draw from
+    # [0, int(framerate*mean_turn_interval)] as random.randint would.
+    critters = numpy.flatnonzero(deciding)
+    highest = (config.framerate*traits[critters, trait_columns["mean_turn_interval"]]).astype(numpy.int64)
+    draws = (state.random.random_sample(len(critters))*(highest + 1)).astype(numpy.int64)
+    critters = critters[draws == 5]
+    turn_angle[critters] = (state.random.randint(0, 5, len(critters))*pi)/2
+
+    return (turn_angle, move_distance, reproduction_target)
+
+def first_pair_per_critter(pair_critters, pairs):
+    """ Given an array of pair indices (ordered so that the preferred pair for
+    each critter comes first), pick out the first pair for each critter.
+    Returns a tuple of arrays (critters, pairs), one entry per critter. """
+    (critters, first) = numpy.unique(pair_critters[pairs], return_index=True)
+    return (critters, pairs[first])
+
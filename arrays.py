@@ -0,0 +1,229 @@
+"""
+arrays.py
+
+Contains the optional NumPy backend, which keeps the state of all
+the critters in contiguous arrays so that it can be updated for every
+critter at once.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+from math import *
+
+from perception import *
+
+# NumPy is only needed for the array backend, so don't insist on it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class CritterArrays(object):
+    """ Struct-of-arrays storage for the state of every critter in a World.
+
+    Each critter (an objects.ArrayCritter) owns one row of the arrays; its
+    x, y, direction, energy, age, iteration_counter and heart_countdown
+    attributes read and write that row. Rows 0 to count-1 are in use, and
+    self.critters[row] is the critter owning each row. Removing a critter
+    moves the last row into the hole it leaves.
+
+    The arrays also hold the critter's gender (male is 1 for "m"), the
+    values of its agent's traits (one column per trait name), and the
+    agent_clock and avoidance_countdown used by agent.compute_next_actions
+    in place of the clock and avoidance_countdown of each critter's Agent.
+
+    Each frame, the World calls perceive, which finds what every critter
+    can see in one batch, then agent.compute_next_actions, which decides
+    what every critter will do, then step, which moves, feeds, ages and
+    kills all the critters together. Unlike the normal backend, every
+    critter decides what to do before any of them move. """
+
+    # Per-critter attributes stored in the arrays, and their types
+    float_fields = ["x", "y", "direction", "energy", "agent_clock", "avoidance_countdown"]
+    int_fields = ["age", "iteration_counter", "heart_countdown", "male"]
+
+    # Codes used in target_types for each type of object
+    type_codes = {"Critter": 0, "Food": 1, "Scenery": 2}
+
+    def __init__(self, config, trait_names, random_state, capacity=256):
+        """ Create an empty set of arrays with room for capacity critters;
+        they grow automatically as critters are added.
+        trait_names - names of the agent traits to store, in column order
+        random_state - numpy.random.RandomState for the batched agent's random turns """
+        if numpy == None:
+            raise ImportError("critter_array_backend requires NumPy")
+
+        self.config = config
+        self.trait_names = trait_names
+        self.count = 0
+        self.capacity = capacity
+        self.critters = []
+
+        # Results of the last call to perceive: the objects which could be
+        # seen, their type codes, and what each critter could see, in the CSR
+        # form returned by perception.find_neighbours
+        self.targets = []
+        self.target_types = None
+        self.neighbours = None
+
+        # Random numbers for the batched agent, drawn for all the critters at once
+        self.random = random_state
+
+        for name in CritterArrays.float_fields:
+            setattr(self, name, numpy.zeros(capacity, dtype=numpy.float64))
+        for name in CritterArrays.int_fields:
+            setattr(self, name, numpy.zeros(capacity, dtype=numpy.int64))
+        self.traits = numpy.zeros((capacity, len(trait_names)), dtype=numpy.float64)
+
+    def array_names(self):
+        """ Get the names of all the per-critter arrays. """
+        return CritterArrays.float_fields + CritterArrays.int_fields + ["traits"]
+
+    def allocate(self, critter):
+        """ Give a new critter a row of the arrays, and return the row. """
+        if self.count == self.capacity:
+            self.grow()
+
+        row = self.count
+        self.count += 1
+        self.critters.append(critter)
+
+        # The row may hold leftovers from a critter which has been released
+        for name in self.array_names():
+            getattr(self, name)[row] = 0
+        return row
+
+    def release(self, row):
+        """ Free a row, moving the last row into its place. The critter
+        which owned the last row has its row attribute updated. """
+        last = self.count - 1
+        if row != last:
+            for name in self.array_names():
+                array = getattr(self, name)
+                array[row] = array[last]
+            moved = self.critters[last]
+            self.critters[row] = moved
+            moved.row = row
+
+        self.critters.pop()
+        self.count -= 1
+
+    def grow(self):
+        """ Double the capacity of every array. """
+        self.capacity *= 2
+        for name in self.array_names():
+            old = getattr(self, name)
+            new = numpy.zeros((self.capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def perceive(self, objects):
+        """ Find the objects visible to every critter, given all the objects
+        in the world. Rows 0 to count-1 of the arrays must hold critters which
+        are in objects. """
+        # The critters come first, so critter i is target i; the positions
+        # of everything else have to be gathered up from the objects
+        others = [obj for obj in objects if obj.get_type() != "Critter"]
+        self.targets = self.critters[:self.count] + others
+        self.target_types = numpy.array([CritterArrays.type_codes["Critter"]]*self.count
+                                        + [CritterArrays.type_codes.get(obj.get_type(), -1)
+                                           for obj in others], dtype=numpy.int64)
+        target_x = numpy.concatenate((self.x[:self.count],
+                                      numpy.array([obj.x for obj in others], dtype=numpy.float64)))
+        target_y = numpy.concatenate((self.y[:self.count],
+                                      numpy.array([obj.y for obj in others], dtype=numpy.float64)))
+
+        self.neighbours = find_neighbours(self.x[:self.count], self.y[:self.count],
+                                          target_x, target_y,
+                                          self.config.world_width, self.config.world_height,
+                                          self.config.critter_view_distance,
+                                          numpy.arange(self.count))
+
+    def visible_objects(self, row):
+        """ Get the objects visible to the critter in the given row, as
+        found by the last call to perceive, as a list of (obj, dx, dy) triples. """
+        (offsets, indices, dx, dy) = self.neighbours
+        start = offsets[row]
+        end = offsets[row + 1]
+        targets = self.targets
+        return [(targets[index], delta_x, delta_y) for (index, delta_x, delta_y)
+                    in zip(indices[start:end].tolist(), dx[start:end].tolist(),
+                           dy[start:end].tolist())]
+
+    def step(self, turn_angle, move_distance, reproduction_target, timer=None):
+        """ Carry out the decisions returned by agent.compute_next_actions: move
+        all the critters, let each one reproduce and eat, then apply energy decay,
+        ageing and death to all of them.
+        timer - FrameTimer to time each of those phases with, or None """
+        # Critters born during this step get their first update next frame
+        count = self.count
+
+        self.apply_movement(count, turn_angle, move_distance)
+        if timer != None:
+            timer.lap("movement")
+
+        # Reproduction and eating involve other objects, so they are done
+        # one critter at a time. Nothing dies until after this loop, so rows
+        # 0 to count-1 still hold the same critters afterwards.
+        for (critter, target) in zip(self.critters[:count], reproduction_target.tolist()):
+            critter.world.spatial_hash.move(critter)
+            if target >= 0:
+                critter.interact(self.targets[target])
+            else:
+                critter.interact(None)
+        if timer != None:
+            timer.lap("interaction")
+
+        for critter in self.apply_decay(count):
+            critter.die()
+        if timer != None:
+            timer.lap("decay")
+
+    def apply_movement(self, count, turn_angle, move_distance):
+        """ Turn and move the first count critters by the given amounts,
+        wrapping them around the edges of the world. """
+        config = self.config
+        direction = self.direction[:count]
+        move_distance = numpy.minimum(move_distance, config.critter_max_move_speed)
+
+        direction += turn_angle
+        direction %= 2*pi
+        self.x[:count] += numpy.cos(direction)*move_distance
+        self.y[:count] += numpy.sin(direction)*move_distance
+
+        # Normalise the coordinates in the range [0, width)x[0, height).
+        # A tiny negative coordinate can round up to exactly width (or
+        # height), so catch that case too.
+        for (coords, size) in ((self.x[:count], config.world_width),
+                               (self.y[:count], config.world_height)):
+            coords %= size
+            coords[coords >= size] = 0
+
+    def apply_decay(self, count):
+        """ Apply energy decay and ageing to the first count critters. Returns
+        a list of the critters which have run out of energy. """
+        config = self.config
+        energy = self.energy[:count]
+        energy -= config.critter_energy_decay_rate
+        dead = [self.critters[row] for row in numpy.flatnonzero(energy <= 0)]
+
+        # update the counter, and update the age and heart once per second
+        iteration_counter = self.iteration_counter[:count]
+        iteration_counter += 1
+        second_passed = iteration_counter % config.framerate == 0
+        self.heart_countdown[:count][second_passed] -= 1
+        self.age[:count][second_passed] += 1
+
+        # The critters which have just reached a new life stage
+        for row in numpy.flatnonzero(second_passed
+                                     & (self.age[:count] % config.ageing_interval == 0)):
+            critter = self.critters[row]
+            critter.world.population_stats.update_life_stage(critter)
+
+        return dead
@@ -0,0 +1,414 @@
+"""
+benchmark.py
+
+Measures how fast the simulation runs as the world gets bigger and more
+crowded, and writes the results as JSON, so that an optimisation can be
+checked against the results from before it (a "baseline").
+
+Usage: python benchmark.py config_file world_spec_file [options]
+
+Each scenario starts from the given config and world specification, and
+changes the number of critters, the food density (food per tile at the
+start) and the scenery density (scenery objects per tile, grouped into
+dense forests like the ones generator.py makes). The world is made big
+enough to keep the critters as crowded as in the world specification, so
+a scenario with 100000 critters has a correspondingly huge world. With
+rendering, only the top-left corner of the world which fits in --view-size
+is drawn, as a window onto a big world would; so the drawing takes about
+as long however big the world is.
+Run "python benchmark.py --help" for the options. For example,
+
+    python benchmark.py evo_config evo_spec --critters 100,1000,10000
+        --output after.json --baseline before.json
+
+runs the scenarios with 100, 1000 and 10000 critters, and compares the
+steps per second of each one to the same scenario in before.json.
+
+Each scenario runs in a process of its own (one at a time, so they don't
+compete for the CPU), which gives its peak memory use. It is run for a few
+warm-up steps, then timed for --steps steps (or --max-seconds, whichever
+comes first) to get the steps per second, then run for as many steps again
+with a FrameTimer (see profiling.py) to get the time each phase takes.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import itertools
+import multiprocessing
+from math import ceil, sqrt
+
+# Peak memory use can only be measured where the resource module exists
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# NumPy is only needed for the array backend (its version is only recorded)
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#imports from our own files
+from main import *
+# A monotonic clock, so adjusting the wall clock doesn't skew the timings
+from profiling import timer
+
+# Written in the results, so that old results files can be recognised
+benchmark_version = 2
+
+# Number of scenery objects in each forest, and the width and height of the
+# square they are in (as in generator.py)
+forest_size = 100
+forest_width = 200
+
+# Types of scenery the forests are made of
+forest_types = ["pine", "dead_tree", "oak", "fern", "stump"]
+
+def make_scenarios(options):
+    """ Get the list of scenarios to run (see run_scenario): every combination
+    of the critter counts, food densities, scenery densities, backends and
+    with and without rendering. """
+    scenarios = []
+    for (critters, food_density, scenery_density, backend, rendering) in itertools.product(
+            options.critters, options.food_densities, options.scenery_densities,
+            options.backends, options.rendering):
+        name = "{0}/critters={1}/food={2}/scenery={3}/{4}/{5}".format(
+            options.config_file, critters, food_density, scenery_density, backend,
+            "rendering" if rendering else "headless")
+        scenarios.append({
+            "name": name,
+            "config_file": options.config_file,
+            "spec_file": options.spec_file,
+            "critters": critters,
+            "food_density": food_density,
+            "scenery_density": scenery_density,
+            "backend": backend,
+            "rendering": rendering,
+            "critter_density": options.critter_density,
+            "warmup": options.warmup,
+            "steps": options.steps,
+            "max_seconds": options.max_seconds,
+            "view_size": options.view_size,
+            "window": options.window,
+        })
+    return scenarios
+
+def make_world_spec(config, scenario, random_stream):
+    """ Change the world specification in config (the tiles and scenery) to
+    the scenario's: a world big enough for the scenario's critters, with the
+    tiles of the original world repeated across it, and the scenery replaced
+    by forests. """
+    critter_density = scenario["critter_density"]
+    if critter_density == None:
+        # As crowded as the original world
+        critter_density = (config.starting_males + config.starting_females) \
+                          / (config.rows*config.cols)
+
+    # A square world, or as near as possible
+    size = max(1, int(ceil(sqrt(scenario["critters"]/critter_density))))
+    tile_spec = [[config.tile_spec[x % config.cols][y % config.rows] for y in xrange(size)]
+                 for x in xrange(size)]
+    world_size = size*config.tile_size
+
+    # Fill forests one at a time, each in a random square of the world
+    scenery = []
+    total = int(round(scenario["scenery_density"]*size*size))
+    width = min(forest_width, world_size)
+    while len(scenery) < total:
+        left = random_stream.randint(0, world_size - width)
+        top = random_stream.randint(0, world_size - width)
+        for i in xrange(min(forest_size, total - len(scenery))):
+            scenery.append([random_stream.choice(forest_types),
+                            left + random_stream.randint(0, width - 1),
+                            top + random_stream.randint(0, width - 1)])
+    config.set_world_spec(size, size, tile_spec, scenery)
+
+def run_scenario(scenario):
+    """ Run one scenario, and return its results, as a dict which is
+    converted straight to JSON. """
+    config = Config(scenario["config_file"], scenario["spec_file"])
+    make_world_spec(config, scenario, random.Random(seed_from_string("benchmark")))
+    config.override("random_seed", "benchmark")
+    config.override("starting_males", str(scenario["critters"]//2))
+    config.override("starting_females", str(scenario["critters"] - scenario["critters"]//2))
+    config.override("critter_array_backend", "1" if scenario["backend"] == "array" else "0")
+    config.override("steps_per_frame", "1")
+
+    # Nothing should be written to files, and frame timing is only
+    # wanted for the second half of the run
+    for setting in Config.setting_dict:
+        if setting.endswith("_export_path") or setting in ("telemetry_path", "record_path"):
+            config.override(setting, "")
+    config.override("frame_timing", "0")
+
+    result = {
+        "name": scenario["name"],
+        "critters": scenario["critters"],
+        "food_density": scenario["food_density"],
+        "scenery_density": scenario["scenery_density"],
+        "backend": scenario["backend"],
+        "rendering": scenario["rendering"],
+        "world_size": [config.world_width, config.world_height],
+        "scenery": len(config.scenery),
+    }
+
+    if scenario["rendering"]:
+        # Draw to an invisible screen, unless asked to open a window; the
+        # World only draws as much of itself as fits on the screen
+        if not scenario["window"]:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+        pygame.init()
+        pygame.font.init()
+        use_cache(AssetCache("cache"))
+        (view_width, view_height) = scenario["view_size"]
+        screen_size = [min(view_width, config.world_width),
+                       min(view_height, config.world_height)]
+        if config.enable_graphs:
+            screen_size[0] += config.graph_width
+        screen = pygame.display.set_mode(screen_size)
+    else:
+        pygame.font.init()
+        disable_loading()
+        screen = None
+
+    start_time = timer()
+    world = World(screen, config)
+
+    # The World starts with some food of its own; add or take away food to
+    # make up the scenario's density
+    food_random = random.Random(seed_from_string("benchmark food"))
+    food = int(round(scenario["food_density"]*config.rows*config.cols))
+    for food_item in [obj for obj in world.objects if obj.get_type() == "Food"][food:]:
+        world.delete(food_item)
+    world.add_many([Food(config, world, 0, food_random.random()*config.world_width,
+                         food_random.random()*config.world_height, config.food_energy)
+                    for i in xrange(food - world.object_count["Food"])])
+    if scenario["rendering"]:
+        world.prepare_rendering()
+        result["view_size"] = list(world.view_rect.size)
+    result["setup_seconds"] = timer() - start_time
+    result["start_critters"] = world.object_count["Critter"]
+    result["start_food"] = world.object_count["Food"]
+
+    run_steps(world, scenario["warmup"], scenario["max_seconds"])
+
+    (steps, seconds) = run_steps(world, scenario["steps"], scenario["max_seconds"])
+    result["steps"] = steps
+    result["seconds"] = seconds
+    result["steps_per_second"] = steps/seconds
+
+    # Time the phases over as many steps again
+    world.frame_timer = FrameTimer(steps)
+    run_steps(world, steps, None)
+    result["phases"] = dict((row[0], dict(zip(
+                                ["mean_ms"] + ["p{0}_ms".format(percentile)
+                                               for percentile in FrameTimer.percentiles],
+                                row[1:])))
+                            for row in world.frame_timer.summary())
+
+    result["end_critters"] = world.object_count["Critter"]
+    result["end_food"] = world.object_count["Food"]
+    result["peak_memory_mb"] = peak_memory()
+    world.finish()
+    return result
+
+def run_steps(world, max_steps, max_seconds):
+    """ Run a World for max_steps steps, or until max_seconds seconds have
+    passed (if not None), drawing every step if it has a screen. At least
+    one step is always run (if max_steps is nonzero). Returns a tuple
+    (number of steps run, seconds taken). """
+    frame_timer = world.frame_timer
+    start_time = timer()
+    steps = 0
+    while steps < max_steps:
+        world.step()
+        if world.screen != None:
+            changed_rects = world.render()
+            if changed_rects == None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(changed_rects)
+            if frame_timer != None:
+                frame_timer.lap("display_flip")
+        if frame_timer != None:
+            frame_timer.end_frame(world.counter)
+        steps += 1
+        if max_seconds != None and timer() - start_time >= max_seconds:
+            break
+    return (steps, timer() - start_time)
+
+def peak_memory():
+    """ Get the peak memory use (resident set size) of this process, in MB,
+    or None if it can't be measured here. """
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives it in kB, but macOS in bytes
+    if sys.platform == "darwin":
+        return peak/(1024*1024)
+    return peak/1024
+
+def compare_to_baseline(results, baseline, tolerance):
+    """ Print how the steps per second of each scenario compares to the
+    same scenario in baseline (a list of results from an earlier run).
+    Returns the names of the scenarios which got slower by more than
+    tolerance (a fraction). """
+    baseline_results = dict((result["name"], result) for result in baseline
+                            if "steps_per_second" in result)
+    slower = []
+    print "{0:<70} {1:>10} {2:>10} {3:>8}".format("Scenario", "Baseline", "Now", "Change")
+    for result in results:
+        if "steps_per_second" not in result or result["name"] not in baseline_results:
+            continue
+        before = baseline_results[result["name"]]["steps_per_second"]
+        after = result["steps_per_second"]
+        change = after/before - 1
+        print "{0:<70} {1:>10.2f} {2:>10.2f} {3:>+7.1f}%".format(
+            result["name"], before, after, 100*change)
+        if change < -tolerance:
+            slower.append(result["name"])
+    return slower
+
+def parse_list(parse):
+    """ Make an argparse type which parses a comma-separated list of values
+    with the given function. """
+    def parse_values(argument):
+        try:
+            return [parse(value.strip()) for value in argument.split(",")]
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid list: {0}".format(argument))
+    return parse_values
+
+def parse_backend(value):
+    if value not in ("object", "array"):
+        raise ValueError(value)
+    return value
+
+def parse_rendering(value):
+    if value not in ("headless", "rendering"):
+        raise ValueError(value)
+    return value == "rendering"
+
+def parse_view_size(argument):
+    """ Parse a --view-size argument ("WIDTHxHEIGHT") into a tuple. """
+    try:
+        (width, height) = [int(value) for value in argument.split("x")]
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid size: {0}".format(argument))
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("invalid size: {0}".format(argument))
+    return (width, height)
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(
+        description="Measure how fast the simulation runs in scenarios of different sizes.")
+    parser.add_argument("config_file", help="configuration file in setups/")
+    parser.add_argument("spec_file", help="world specification file in setups/")
+    parser.add_argument("--critters", type=parse_list(int), default=[100, 1000, 10000, 100000],
+                        help="numbers of critters to try (default 100,1000,10000,100000)")
+    parser.add_argument("--food", dest="food_densities", type=parse_list(float),
+                        default=[0.1, 1.0],
+                        help="food densities (food per tile at the start) to try "
+                             "(default 0.1,1)")
+    parser.add_argument("--scenery", dest="scenery_densities", type=parse_list(float),
+                        default=[0.0, 1.0],
+                        help="scenery densities (scenery objects per tile, in forests) "
+                             "to try (default 0,1)")
+    parser.add_argument("--backends", type=parse_list(parse_backend),
+                        default=["object", "array"],
+                        help="critter backends to try: object and/or array (default both)")
+    parser.add_argument("--rendering", type=parse_list(parse_rendering),
+                        default=[False, True],
+                        help="headless and/or rendering (default both)")
+    parser.add_argument("--critter-density", type=float, default=None,
+                        help="critters per tile (default: as in the world specification)")
+    parser.add_argument("--warmup", type=int, default=5,
+                        help="steps to run before timing (default 5)")
+    parser.add_argument("--steps", type=int, default=100,
+                        help="steps to time in each scenario (default 100)")
+    parser.add_argument("--max-seconds", type=float, default=20.0,
+                        help="stop timing a scenario after this many seconds (default 20)")
+    parser.add_argument("--view-size", type=parse_view_size, default=(1024, 768),
+                        help="size in pixels of the part of the world drawn when "
+                             "rendering, as WIDTHxHEIGHT (default 1024x768)")
+    parser.add_argument("--window", action="store_true",
+                        help="render to a real window, instead of an invisible one")
+    parser.add_argument("--output", default="benchmark.json",
+                        help="file to write the results to (default benchmark.json)")
+    parser.add_argument("--baseline", default=None,
+                        help="results file from an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="fraction the steps per second can drop by before a scenario "
+                             "counts as slower than the baseline (default 0.1)")
+    return parser.parse_args(arguments)
+
+if __name__ == '__main__':
+    options = parse_arguments(sys.argv[1:])
+
+    # Check the base configuration before starting any processes
+    try:
+        Config(options.config_file, options.spec_file, AssetCache("cache"))
+    except ConfigParseException as ex:
+        print ex
+        sys.exit(1)
+
+    baseline = None
+    if options.baseline != None:
+        try:
+            with open(options.baseline) as in_file:
+                baseline = json.load(in_file)["results"]
+        except (IOError, ValueError, KeyError) as ex:
+            print "Couldn't read the baseline: {0}".format(ex)
+            sys.exit(1)
+
+    scenarios = make_scenarios(options)
+    print "Running {0} scenarios".format(len(scenarios))
+
+    # A new process for each scenario, so each one's peak memory is its own
+    pool = multiprocessing.Pool(1, maxtasksperchild=1)
+    results = []
+    try:
+        for result in pool.imap(run_scenario, scenarios):
+            results.append(result)
+            print "[{0}/{1}] {2}: {3:.2f} steps per second".format(
+                len(results), len(scenarios), result["name"], result["steps_per_second"])
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print "Interrupted; writing the results of the finished scenarios"
+    pool.join()
+
+    with open(options.output, "w") as out_file:
+        json.dump({
+            "version": benchmark_version,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": numpy.__version__ if numpy != None else None,
+            "pygame": pygame.version.ver,
+            "config_file": options.config_file,
+            "spec_file": options.spec_file,
+            "view_size": options.view_size,
+            "results": results
+        }, out_file, indent=2, sort_keys=True)
+    print "Wrote {0} results to {1}".format(len(results), options.output)
+
+    if baseline != None:
+        slower = compare_to_baseline(results, baseline, options.tolerance)
+        if slower != []:
+            print "{0} scenarios are slower than the baseline".format(len(slower))
+            sys.exit(2)
@@ -0,0 +1,162 @@
+"""
+cache.py
+
+Contains the AssetCache, which keeps the results of loading files
+(parsed configurations, decoded images) on disk so that later runs
+don't have to load them again.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import os
+from os import path
+import mmap
+import hashlib
+import cPickle as pickle
+
+class AssetCache(object):
+    """ An on-disk cache of things computed from source files.
+
+    Each entry has a name, and records the source files it was computed
+    from. An entry is only returned if none of its sources have changed:
+    a source is unchanged if its modification time and size are the same
+    as when the entry was stored, or failing that, if its contents still
+    have the same SHA-1 hash (in which case the stored modification time is
+    brought up to date, so the hash needn't be checked again).
+
+    Entries hold either a picklable value (get/put), or some metadata plus a
+    block of raw bytes which is memory-mapped when read (get_raw/put_raw).
+    Any problem reading an entry is treated as a miss, and any problem
+    writing one is ignored; the cache can always be deleted safely. """
+
+    # Increase when the format of the entries changes
+    version = 1
+
+    def __init__(self, directory):
+        """ Create a cache storing its entries in the given directory,
+        which is created when first needed. """
+        self.directory = directory
+
+    def get(self, name, sources):
+        """ Get the value stored under name, or None if there isn't one or
+        any of the source files it depends on have changed. """
+        entry = self.read_entry(name, sources)
+        if entry == None:
+            return None
+        return entry["value"]
+
+    def put(self, name, sources, value):
+        """ Store a value under name, computed from the given source files. """
+        self.write_entry(name, sources, value)
+
+    def get_raw(self, name, sources):
+        """ Get the metadata and raw bytes stored under name, as a tuple
+        (metadata, buffer), or None if there are none or they're out of date.
+        The buffer is a private, writable memory map of the bytes. """
+        entry = self.read_entry(name, sources)
+        if entry == None:
+            return None
+        try:
+            with open(self.entry_path(name, ".raw"), "rb") as raw_file:
+                if os.fstat(raw_file.fileno()).st_size != entry["raw_size"]:
+                    return None
+                if entry["raw_size"] == 0:
+                    return (entry["value"], bytearray())
+                buf = mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (IOError, OSError, EnvironmentError):
+            return None
+        return (entry["value"], buf)
+
+    def put_raw(self, name, sources, metadata, data):
+        """ Store some (picklable) metadata and a string of raw bytes under
+        name, computed from the given source files. """
+        try:
+            self.make_directory()
+            with open(self.entry_path(name, ".raw"), "wb") as raw_file:
+                raw_file.write(data)
+        except (IOError, OSError):
+            return
+        self.write_entry(name, sources, metadata, len(data))
+
+    def read_entry(self, name, sources):
+        """ Read the entry for name, checking that it was computed from the
+        given sources and that they haven't changed. Returns None if not. """
+        try:
+            with open(self.entry_path(name, ".pickle"), "rb") as entry_file:
+                entry = pickle.load(entry_file)
+        except Exception:
+            # Missing, unreadable or corrupt; it'll be rebuilt
+            return None
+
+        if entry.get("version") != AssetCache.version \
+                or sorted(entry["sources"]) != sorted(sources):
+            return None
+
+        refreshed = False
+        for source in sources:
+            (mtime, size, digest) = entry["sources"][source]
+            try:
+                stat = os.stat(source)
+            except OSError:
+                return None
+            if (stat.st_mtime, stat.st_size) == (mtime, size):
+                continue
+            if file_digest(source) != digest:
+                return None
+            entry["sources"][source] = (stat.st_mtime, stat.st_size, digest)
+            refreshed = True
+
+        if refreshed:
+            self.store_entry(name, entry)
+        return entry
+
+    def write_entry(self, name, sources, value, raw_size=None):
+        """ Record the state of the sources, and store an entry for name. """
+        try:
+            source_states = {}
+            for source in sources:
+                stat = os.stat(source)
+                source_states[source] = (stat.st_mtime, stat.st_size, file_digest(source))
+        except (IOError, OSError):
+            return
+        self.store_entry(name, {"version": AssetCache.version,
+                                "sources": source_states,
+                                "value": value,
+                                "raw_size": raw_size})
+
+    def store_entry(self, name, entry):
+        """ Write an entry to disk. Writes to a temporary file first, so a
+        reader never sees half an entry. """
+        entry_path = self.entry_path(name, ".pickle")
+        temp_path = entry_path + ".tmp"
+        try:
+            self.make_directory()
+            with open(temp_path, "wb") as entry_file:
+                pickle.dump(entry, entry_file, pickle.HIGHEST_PROTOCOL)
+            if os.name == "nt" and path.exists(entry_path):
+                # Windows can't rename over an existing file
+                os.remove(entry_path)
+            os.rename(temp_path, entry_path)
+        except (IOError, OSError, pickle.PicklingError):
+            pass
+
+    def entry_path(self, name, extension):
+        """ Get the path of one of the files for the entry called name. """
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        return path.join(self.directory, safe_name + extension)
+
+    def make_directory(self):
+        if not path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+def file_digest(filename):
+    """ Get the SHA-1 hash of a file's contents, as a hex string. """
+    digest = hashlib.sha1()
+    with open(filename, "rb") as source_file:
+        for block in iter(lambda: source_file.read(65536), ""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,274 @@
+"""
+checkpoint.py
+
+Contains Checkpoint, which saves the whole state of a running World so
+that it can be restored later, or forked into several different runs.
+
+For example, to evolve a population once and then try two settings on it:
+
+    checkpoint = take_checkpoint(world)
+    checkpoint.save("evolved.checkpoint")
+    ...
+    checkpoint = load_checkpoint("evolved.checkpoint")
+    config.override("food_spawn_period", "5")
+    world = checkpoint.fork(None, config)
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import sys
+import zlib
+import array
+import cPickle as pickle
+
+#imports from our own files
+from main import *
+
+# Written at the start of every saved checkpoint; change the number when
+# the format changes
+checkpoint_magic = "Critters checkpoint 1\n"
+
+# Per-critter values saved, and the array typecode each is packed with
+critter_fields = [("object_ID", "i"), ("x", "d"), ("y", "d"), ("direction", "d"),
+                  ("energy", "d"), ("age", "i"), ("iteration_counter", "i"),
+                  ("heart_countdown", "i"), ("clock", "d"), ("avoidance_countdown", "d")]
+food_fields = [("object_ID", "i"), ("x", "d"), ("y", "d"), ("energy", "d")]
+skeleton_fields = [("object_ID", "i"), ("x", "d"), ("y", "d"), ("countdown", "i")]
+
+class Checkpoint(object):
+    """ A saved copy of the state of a World, taken between frames: every
+    critter (position, direction, energy, age, counters and gender, and its
+    agent's traits and clocks), food item and skeleton, the graphs, the
+    random streams, and the frame counter. The scenery isn't saved, since
+    it comes from the world specification in the config.
+
+    restore gives a World which carries on exactly as the saved one would
+    have, given the same config. fork gives a World which starts from the
+    same state, but draws new random numbers, seeded from the random_seed
+    setting of the config it's given; fork with different seeds or settings
+    to branch off several variants without re-running what came before.
+
+    A Checkpoint can be restored or forked any number of times. It is
+    stored (see save and to_bytes) with the values of each kind of object
+    packed into one column of binary numbers per attribute, compressed. """
+
+    def __init__(self, state):
+        """ Create a Checkpoint from the state dict built by take_checkpoint;
+        use take_checkpoint, load_checkpoint or checkpoint_from_bytes instead. """
+        self.state = state
+
+    def to_bytes(self):
+        """ Get the checkpoint as a string of bytes, which checkpoint_from_bytes
+        turns back into a Checkpoint. """
+        return checkpoint_magic + zlib.compress(
+            pickle.dumps(self.state, pickle.HIGHEST_PROTOCOL), 6)
+
+    def save(self, filename):
+        """ Write the checkpoint to a file, which load_checkpoint can read. """
+        with open(filename, "wb") as out_file:
+            out_file.write(self.to_bytes())
+
+    def restore(self, screen, config):
+        """ Create a World in the saved state, which carries on exactly as
+        the saved World would have. screen and config are as for World; the
+        config should be the one the saved World was using. """
+        return self.make_world(screen, config, True)
+
+    def fork(self, screen, config):
+        """ Create a World in the saved state, except that its random numbers
+        come from the config's random_seed setting (so an empty random_seed
+        gives a different branch every time). The other settings may differ
+        from the saved World's too, as long as the world size is the same. """
+        return self.make_world(screen, config, False)
+
+    def make_world(self, screen, config, restore_random):
+        """ Create a World from the checkpoint, for restore and fork. """
+        state = self.state
+        if (config.world_width, config.world_height) != state["world_size"]:
+            raise ValueError("The checkpoint is of a {0}x{1} world, not {2}x{3}".format(
+                state["world_size"][0], state["world_size"][1],
+                config.world_width, config.world_height))
+
+        world = World(screen, config, populate=False)
+        if restore_random:
+            world.random_streams.set_state(state["random_streams"])
+        world.counter = state["counter"]
+        world.steps_per_frame = state["steps_per_frame"]
+        world.object_IDs.next_ID = state["next_ID"]
+        for (name, value) in state["birds"].items():
+            setattr(world, name, value)
+
+        # Critters go first, in the order they were created in, so that
+        # ArrayCritters get back the same rows of the CritterArrays
+        objs = {}
+        critters = unpack_columns(state["critters"], critter_fields, state["byteorder"])
+        traits = unpack_traits(state["critter_traits"], state["byteorder"])
+        for (row, gender) in enumerate(state["critter_genders"]):
+            critter = make_critter(world, gender,
+                                   dict((name, column[row]) for (name, column) in critters.items()),
+                                   dict((name, column[row]) for (name, column) in traits.items()))
+            objs[critter.object_ID] = critter
+
+        food = unpack_columns(state["food"], food_fields, state["byteorder"])
+        for row in xrange(len(food["object_ID"])):
+            food_item = Food(config, world, food["object_ID"][row], food["x"][row],
+                             food["y"][row], food["energy"][row])
+            objs[food_item.object_ID] = food_item
+
+        # Put everything back in the same order, since that decides the
+        # order things happen in (the scenery is always first in each cell
+        # of the spatial hash, since it was there from the start)
+        for object_ID in state["object_order"]:
+            obj = objs[object_ID]
+            world.objects.add_with_ID(obj)
+            world.object_count[obj.get_type()] += 1
+            if obj.get_type() == "Critter":
+                world.population_stats.add(obj)
+        for object_ID in state["spatial_hash_order"]:
+            world.spatial_hash.insert(objs[object_ID])
+        for object_ID in state["food_index_order"]:
+            world.food_index.insert(objs[object_ID])
+
+        skeletons = unpack_columns(state["skeletons"], skeleton_fields, state["byteorder"])
+        for row in xrange(len(skeletons["object_ID"])):
+            skeleton = Skeleton(config, world, skeletons["object_ID"][row],
+                                skeletons["x"][row], skeletons["y"][row], get_skeleton(),
+                                config.skeleton_horizontal_offset,
+                                config.skeleton_vertical_offset)
+            skeleton.countdown = skeletons["countdown"][row]
+            world.skeletons.add_with_ID(skeleton)
+
+        # The graphs can only be restored if they're the same ones
+        for (graph, (graph_type, graph_state)) in zip(world.graphs, state["graphs"]):
+            if type(graph).__name__ == graph_type:
+                graph.set_state(graph_state)
+
+        return world
+
+def take_checkpoint(world):
+    """ Save the state of a World in a Checkpoint. Must be called between
+    frames (not during World.step). """
+    if world.pending_deletions != []:
+        raise ValueError("Checkpoints can only be taken between frames")
+
+    # Critters in the order they were created in (see Checkpoint.make_world)
+    if world.critter_state != None:
+        critters = world.critter_state.critters[:world.critter_state.count]
+    else:
+        critters = [obj for obj in world.objects if obj.get_type() == "Critter"]
+    food = [obj for obj in world.objects if obj.get_type() == "Food"]
+
+    return Checkpoint({
+        "byteorder": sys.byteorder,
+        "world_size": (world.config.world_width, world.config.world_height),
+        "counter": world.counter,
+        "steps_per_frame": world.steps_per_frame,
+        "next_ID": world.object_IDs.next_ID,
+        "random_streams": world.random_streams.get_state(),
+        "birds": dict((name, getattr(world, name)) for name in
+                      ["eagle_on", "eagle_x", "eagle_y", "eagle_start",
+                       "dove_on", "dove_x", "dove_y", "dove_start"]),
+        "critters": pack_critters(critters),
+        "critter_traits": pack_traits(critters),
+        "critter_genders": "".join(critter.gender for critter in critters),
+        "food": pack_objects(food, food_fields),
+        "skeletons": pack_objects(world.skeletons, skeleton_fields),
+        "object_order": [obj.object_ID for obj in world.objects],
+        "spatial_hash_order": [obj.object_ID for cell in world.spatial_hash.cells
+                                   for obj in cell if obj.get_type() != "Scenery"],
+        "food_index_order": [obj.object_ID for cell in world.food_index.cells for obj in cell],
+        "graphs": [(type(graph).__name__, graph.get_state()) for graph in world.graphs]
+    })
+
+def make_critter(world, gender, values, traits):
+    """ Create a critter in the given World (without adding it) from
+    its gender, the values of critter_fields and its agent's traits. """
+    if gender == "m":
+        images = get_male_images()
+    else:
+        images = get_female_images()
+    critter = world.critter_class(world.config, world, values["object_ID"],
+                                  values["x"], values["y"], values["direction"],
+                                  values["iteration_counter"], values["age"], images, gender)
+    critter.energy = values["energy"]
+    critter.heart_countdown = values["heart_countdown"]
+    critter.agent.traits = traits
+    if world.critter_state != None:
+        critter_state = world.critter_state
+        critter_state.traits[critter.row] = [traits[name] for name in critter_state.trait_names]
+        critter_state.agent_clock[critter.row] = values["clock"]
+        critter_state.avoidance_countdown[critter.row] = values["avoidance_countdown"]
+    else:
+        critter.agent.clock = int(values["clock"])
+        critter.agent.avoidance_countdown = values["avoidance_countdown"]
+    return critter
+
+def pack_critters(critters):
+    """ Pack the values of critter_fields for a list of critters, as with
+    pack_columns. """
+    columns = dict((name, []) for (name, typecode) in critter_fields)
+    for critter in critters:
+        for name in ["object_ID", "x", "y", "direction", "energy", "age",
+                     "iteration_counter", "heart_countdown"]:
+            columns[name].append(getattr(critter, name))
+
+        # With the array backend, the agents' clocks are in the arrays
+        critter_state = critter.world.critter_state
+        if critter_state != None:
+            columns["clock"].append(critter_state.agent_clock.item(critter.row))
+            columns["avoidance_countdown"].append(
+                critter_state.avoidance_countdown.item(critter.row))
+        else:
+            columns["clock"].append(critter.agent.clock)
+            columns["avoidance_countdown"].append(critter.agent.avoidance_countdown)
+    return pack_columns(columns, critter_fields)
+
+def pack_traits(critters):
+    """ Pack the agent traits of a list of critters, as with pack_columns. """
+    return pack_columns(dict((name, [critter.agent.traits[name] for critter in critters])
+                             for name in Agent.trait_names),
+                        [(name, "d") for name in Agent.trait_names])
+
+def unpack_traits(packed, byteorder):
+    """ Unpack the traits from pack_traits. """
+    return unpack_columns(packed, [(name, "d") for name in Agent.trait_names], byteorder)
+
+def pack_objects(objs, fields):
+    """ Pack the attributes named in fields of a list of objects, as with
+    pack_columns. """
+    return pack_columns(dict((name, [getattr(obj, name) for obj in objs])
+                             for (name, typecode) in fields), fields)
+
+def checkpoint_from_bytes(data):
+    """ Turn a string of bytes from Checkpoint.to_bytes back into a Checkpoint.
+    Raises ValueError if it isn't a checkpoint (of this version). """
+    if not data.startswith(checkpoint_magic):
+        raise ValueError("Not a checkpoint, or from a different version")
+    return Checkpoint(pickle.loads(zlib.decompress(data[len(checkpoint_magic):])))
+
+def load_checkpoint(filename):
+    """ Read a Checkpoint from a file written by Checkpoint.save. """
+    with open(filename, "rb") as in_file:
+        return checkpoint_from_bytes(in_file.read())
+
+def pack_columns(columns, fields):
+    """ Pack a dict of lists of numbers into a dict of strings of bytes, given
+    a list of (name, array typecode) pairs for the lists. """
+    return dict((name, array.array(typecode, columns[name]).tostring())
+                for (name, typecode) in fields)
+
+def unpack_columns(packed, fields, byteorder):
+    """ Unpack a dict from pack_columns, which was packed on a machine
+    with the given byte order. """
+    columns = {}
+    for (name, typecode) in fields:
+        column = array.array(typecode)
+        column.fromstring(packed[name])
+        if byteorder != sys.byteorder:
+            column.byteswap()
+        columns[name] = column.tolist()
+    return columns
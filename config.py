@@ -11,9 +11,23 @@ were provided for by REFMAP(http://www.tekepon.net/fsm)
 """
 
 import os
+import copy
 from os import path
 
-class Config:
+# Path of the source of this module; cached configurations depend on it,
+# since it defines how the files are parsed
+source_path = path.relpath(path.splitext(__file__)[0] + ".py")
+
+def choice(*options):
+    """ Make a parsing function for a setting which must be one of the given
+    strings. """
+    def parse(value):
+        if value not in options:
+            raise ValueError("expected one of: " + ", ".join(options))
+        return value
+    return parse
+
+class Config(object):
     """ Parses and stores settings from the configuration file
     and world specification file.
 
@@ -22,13 +36,26 @@ class Config:
     is not known at programming time, with the dictionary lookup syntax
     ("config['setting']").
 
+    Every setting is compiled into a slot of its own, so reading one is as
+    cheap as reading any plain attribute. A Config can't be changed by
+    assigning to it; use override or set_world_spec, which keep the
+    virtual settings up to date.
+
     In addition to the settings defined in setting_dict,
     there are some "virtual settings":
         critter_view_distance_sq, collision_radius_sq, reproduction_radius_sq, scenery_avoidance_radius_sq
             The square of critter_view_distance, collision_radius, etc... respectively
 
         world_width, world_height
-            Size of the world in pixels. """
+            Size of the world in pixels.
+
+        trait_bounds
+            Map from the name of each setting with <name>_min and <name>_max
+            settings (the agent traits) to the tuple (min, max).
+
+    world_spec_version counts the times the world specification has been
+    replaced (by set_world_spec), so that anything built from it can tell
+    when it's out of date. """
     
     # Map from setting name to a string parsing function
     # To add a new config setting, just add an entry to this dictionary.
@@ -87,6 +114,7 @@ class Config:
         "agent_move_speed_graph_scale_division": float,
         "agent_move_speed_graph_update_period": int,
         "agent_move_speed_graph_export_path": str,
+        "trait_histogram_bins": int,
         
         # Graphical settings
         "framerate": int,
@@ -105,7 +133,22 @@ class Config:
         "skeleton_vertical_offset" : int,
         "skeleton_horizontal_offset" : int,
         "skeleton_time" : int,
-        "small_object_offset" : int
+        "small_object_offset" : int,
+
+        # Performance settings
+        "critter_array_backend" : int,
+        "steps_per_frame" : int,
+        "dirty_rect_rendering" : int,
+        "frame_timing" : int,
+        "frame_timing_window" : int,
+        "frame_timing_hud" : int,
+        "frame_timing_export_path" : str,
+
+        # Recording settings
+        "record_path" : str,
+        "record_keyframe_interval" : int,
+        "telemetry_path" : str,
+        "telemetry_format" : choice("csv", "binary")
     }
         
     tiles_dict = {
@@ -116,17 +159,110 @@ class Config:
       "sand" : "s",
       "dirt" : "i",
     }   
-   
-    def __init__(self, conf_filename, spec_filename):
+
+    # Names of the virtual settings, worked out by compute_virtual_settings
+    virtual_settings = [
+        "critter_view_distance_sq",
+        "collision_radius_sq",
+        "reproduction_radius_sq",
+        "scenery_avoidance_radius_sq",
+        "world_width",
+        "world_height",
+        "trait_bounds"
+    ]
+
+    __slots__ = ["settings", "rows", "cols", "tile_spec", "scenery", "world_spec_version"] \
+                + list(setting_dict) + virtual_settings
+
+    def __init__(self, conf_filename, spec_filename, cache=None):
         """ Create a new Config option, given the name of the config file
         and world spec file (excluding "setups/"). Throws ConfigParseException
-        if the config file is invalid. """
-        self.settings = {}
+        if the config file is invalid.
+        cache - optional AssetCache; if given, the parsed files are kept in it,
+                and only parsed again if they (or this module) change """
+        conf_path = path.relpath("setups/" + conf_filename)
+        spec_path = path.relpath("setups/" + spec_filename)
+
+        parsed = None
+        if cache != None:
+            cache_name = "config_" + conf_filename + "_" + spec_filename
+            sources = [conf_path, spec_path, source_path]
+            parsed = cache.get(cache_name, sources)
+
+        if parsed == None:
+            parsed = (self.parse_config(conf_path),) + self.parse_spec(spec_path)
+            if cache != None:
+                cache.put(cache_name, sources, parsed)
+
+        (settings, rows, cols, tile_spec, scenery) = parsed
+        self.compile(settings, rows, cols, tile_spec, scenery)
+
+    def compile(self, settings, rows, cols, tile_spec, scenery):
+        """ Set every slot from a map from setting name to value and the
+        world specification, working out the virtual settings. This is the
+        only place a Config's slots are set. """
+        set_slot = object.__setattr__
+        if getattr(self, "tile_spec", None) is not tile_spec:
+            set_slot(self, "world_spec_version", getattr(self, "world_spec_version", -1) + 1)
+        set_slot(self, "settings", settings)
+        for (name, value) in settings.iteritems():
+            set_slot(self, name, value)
+        set_slot(self, "rows", rows)
+        set_slot(self, "cols", cols)
+        set_slot(self, "tile_spec", tile_spec)
+        set_slot(self, "scenery", scenery)
+
+        for (name, value) in self.compute_virtual_settings().iteritems():
+            set_slot(self, name, value)
+
+    def compute_virtual_settings(self):
+        """ Work out the virtual settings from the real ones, returning a
+        map from virtual setting name to value. """
+        virtual = {}
+
+        # Precompute some squares of distances
+        virtual["critter_view_distance_sq"] = self.critter_view_distance**2
+        virtual["collision_radius_sq"] = self.collision_radius**2
+        virtual["reproduction_radius_sq"] = self.reproduction_radius**2
+        virtual["scenery_avoidance_radius_sq"] = self.scenery_avoidance_radius**2
+
+        # world dimensions in pixels
+        virtual["world_width"] = self.cols * self.tile_size
+        virtual["world_height"] = self.rows * self.tile_size
+
+        # The bounds of each agent trait, so that agents don't have to build
+        # the names of the _min and _max settings every time
+        virtual["trait_bounds"] = dict(
+            (name, (self.settings[name + "_min"], self.settings[name + "_max"]))
+            for name in self.settings
+            if name + "_min" in self.settings and name + "_max" in self.settings)
+
+        return virtual
+
+    def override(self, name, value):
+        """ Change a setting, given its new value as a string (as it would be
+        written in a config file); the virtual settings are updated to match.
+        Throws ConfigParseException if the setting or value is invalid. """
+        if name not in Config.setting_dict:
+            raise ConfigParseException("Unknown config setting: {0}".format(name))
+        settings = dict(self.settings)
+        try:
+            settings[name] = Config.setting_dict[name](value)
+        except ValueError:
+            raise ConfigParseException("Invalid value for '{0}': {1}".format(name, value))
+        self.compile(settings, self.rows, self.cols, self.tile_spec, self.scenery)
+
+    def set_world_spec(self, rows, cols, tile_spec, scenery):
+        """ Replace the world specification (as parse_spec returns it); the
+        virtual settings are updated to match. """
+        self.compile(self.settings, rows, cols, tile_spec, scenery)
+
+    def parse_config(self, conf_path):
+        """ Read the settings from a config file, returning a map from setting
+        name to value. Throws ConfigParseException if the file is invalid. """
+        settings = {}
         errors = []
 
-        # Read config file
-        conf_string = "setups/" + conf_filename
-        conf_path = path.relpath(conf_string)
         with open(conf_path) as conf_file:
             for line in conf_file.readlines():
                 line = line.strip()
@@ -139,7 +275,7 @@ class Config:
                         # it to parse the value; also, check that it's valid setting
                         parse_function = Config.setting_dict[key]
                         try:
-                            self.settings[key] = parse_function(value)
+                            settings[key] = parse_function(value)
                         except:
                             # Parse_function threw an exception
                             errors.append("Invalid value for '{0}': {1}".format(key, value))
@@ -149,54 +285,65 @@ class Config:
 
         # Check that all settings are present
         for setting in Config.setting_dict.iterkeys():
-            if setting not in self.settings:
+            if setting not in settings:
                 errors.append("Missing config setting: {0}".format(setting))
 
         if errors != []:
             raise ConfigParseException("\n".join(errors))
 
-        # Precompute some squares of distances
-        self.critter_view_distance_sq = self.settings["critter_view_distance"]**2
-        self.collision_radius_sq = self.settings["collision_radius"]**2
-        self.reproduction_radius_sq = self.settings["reproduction_radius"]**2
-        self.scenery_avoidance_radius_sq = self.settings["scenery_avoidance_radius"]**2
-        
-        # Read the world specification file
-        spec_string = "setups/" + spec_filename
-        spec_path = path.relpath(spec_string)
+        return settings
+
+    def parse_spec(self, spec_path):
+        """ Read a world specification file, returning a tuple
+        (rows, cols, tile_spec, scenery). """
         spec_file = open(spec_path)
         first_line = spec_file.readline()
         (rows, cols) = first_line.split()
-        self.rows = int(rows)
-        self.cols = int(cols)
+        rows = int(rows)
+        cols = int(cols)
         
         # making something to hold info on
-        self.scenery = []                
+        scenery = []                
         # making a matrix of g's
-        self.tile_spec = [["g" for a in xrange(self.rows)] for b in xrange(int(self.cols))]
+        tile_spec = [["g" for a in xrange(rows)] for b in xrange(int(cols))]
         # adding in the other tiles
         for line in spec_file:
             (type, colon, x, y) = line.split()
             if type in self.tiles_dict:
                 letter = self.tiles_dict[type]
-                self.tile_spec[int(x)][int(y)] = letter
+                tile_spec[int(x)][int(y)] = letter
             else:
-                self.scenery.append([type, int(x), int(y)])
+                scenery.append([type, int(x), int(y)])
 
         spec_file.close()
 
-        # world dimensions in pixels
-        self.world_width = self.cols * self.settings["tile_size"]
-        self.world_height = self.rows * self.settings["tile_size"]
+        return (rows, cols, tile_spec, scenery)
 
     def __getitem__(self, name):
-        # Operator overload for "config[name]"
-        return getattr(self, name)
-    
-    def __getattr__(self, name):
-        # Called when an attribute of a Config object is found, but Python
-        # can't find it normally. Instead we return the correct config value.
-        return self.settings[name]
+        # Operator overload for "config[name]"; like a dict, an unknown
+        # name is a KeyError
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Config settings can't be assigned to; use override "
+                             "or set_world_spec to change '{0}'".format(name))
+
+    # Copying and pickling go through compile, since the slots can't be
+    # assigned to directly
+    def __getstate__(self):
+        return (self.settings, self.rows, self.cols, self.tile_spec, self.scenery)
+
+    def __setstate__(self, state):
+        self.compile(*state)
+
+    def __deepcopy__(self, memo):
+        config = Config.__new__(Config)
+        memo[id(self)] = config
+        config.compile(*copy.deepcopy(self.__getstate__(), memo))
+        return config
 
 
 class ConfigParseException(Exception):
@@ -0,0 +1,91 @@
+"""
+depth.py
+
+Contains the DepthOrder, which keeps the World's objects in the order
+they should be drawn in from frame to frame.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from bisect import bisect_left
+from operator import attrgetter
+
+class DepthOrder(object):
+    """ Keeps objects in back-to-front drawing order: in order of y-coordinate,
+    so that if A is behind B, A is drawn first and B appears in front. Objects
+    level with each other are ordered by object_ID.
+
+    Static objects (everything but critters) never move, so they are kept in
+    a sorted list, with new ones inserted in place. The moving objects are kept
+    in a separate list which is re-sorted by sort_moving each frame; since
+    critters only move a little each frame, the list is nearly sorted already,
+    which Python's sort takes advantage of (it runs in close to linear time).
+    A removed moving object is replaced by the last one in the list, which
+    sort_moving puts back in place. Iterating over the DepthOrder merges the
+    two lists. """
+
+    # Sort key giving the drawing order
+    sort_key = attrgetter("y", "object_ID")
+
+    def __init__(self, objs=()):
+        """ Create a DepthOrder containing the given objects. """
+        self.static_keys = []
+        self.static_objs = []
+        self.moving = []
+
+        # Map from each moving object to its index in self.moving
+        self.moving_indices = {}
+        for obj in objs:
+            self.add(obj)
+
+    def __len__(self):
+        return len(self.static_objs) + len(self.moving)
+
+    def add(self, obj):
+        """ Add an object to the order. """
+        if obj.get_type() == "Critter":
+            self.moving_indices[obj] = len(self.moving)
+            self.moving.append(obj)
+        else:
+            key = (obj.y, obj.object_ID)
+            index = bisect_left(self.static_keys, key)
+            self.static_keys.insert(index, key)
+            self.static_objs.insert(index, obj)
+
+    def remove(self, obj):
+        """ Remove an object from the order. """
+        if obj.get_type() == "Critter":
+            index = self.moving_indices.pop(obj)
+            last = self.moving.pop()
+            if last is not obj:
+                self.moving[index] = last
+                self.moving_indices[last] = index
+        else:
+            index = bisect_left(self.static_keys, (obj.y, obj.object_ID))
+            del self.static_keys[index]
+            del self.static_objs[index]
+
+    def sort_moving(self):
+        """ Bring the moving objects back into order after they have moved.
+        Must be called before iterating if anything has moved. """
+        self.moving.sort(key=DepthOrder.sort_key)
+        self.moving_indices = dict((obj, index) for (index, obj) in enumerate(self.moving))
+
+    def __iter__(self):
+        """ Iterate over all the objects, back to front. """
+        static_keys = self.static_keys
+        static_objs = self.static_objs
+        num_static = len(static_objs)
+        index = 0
+        for obj in self.moving:
+            key = (obj.y, obj.object_ID)
+            while index < num_static and static_keys[index] < key:
+                yield static_objs[index]
+                index += 1
+            yield obj
+        for index in xrange(index, num_static):
+            yield static_objs[index]
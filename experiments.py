@@ -0,0 +1,239 @@
+"""
+experiments.py
+
+Runs batches of headless simulations in parallel, for parameter sweeps
+and replicates, and writes one table with the results of every run.
+
+Usage: python experiments.py config_file world_spec_file frames [options]
+
+Each run lasts at most frames frames, and stops early if all the critters
+die (or, with --steady-window, if the population stops changing). Run
+"python experiments.py --help" for the options. For example,
+
+    python experiments.py evo_config evo_spec 20000 --seeds 5
+        --set critter_max_move_speed=2,3,4 --set food_spawn_period=5,10
+
+runs 30 simulations: 5 seeds for each of the 6 combinations of settings.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+import sys
+import csv
+import time
+import argparse
+import itertools
+import multiprocessing
+from collections import deque
+
+#imports from our own files
+from main import *
+
+class SteadyStateDetector(object):
+    """ Decides when a run has reached a steady state: when the critter
+    population has stayed within tolerance (a fraction) of its mean over
+    the last window frames. Pass it to World.run_headless as should_stop.
+
+    Until the population has changed at least once, and warmup frames have
+    passed, it's only flat because nothing has been born or died yet, so
+    no samples are taken before then. """
+
+    # Number of times the population is sampled in each window
+    samples_per_window = 20
+
+    def __init__(self, window, tolerance, warmup):
+        self.window = window
+        self.tolerance = tolerance
+        self.warmup = warmup
+        self.sample_period = max(1, window//SteadyStateDetector.samples_per_window)
+        self.samples = deque(maxlen=window//self.sample_period + 1)
+        self.frames = 0
+        self.steady = False
+
+        # The population on the first frame, and whether it's changed since
+        self.initial_population = None
+        self.population_changed = False
+
+    def __call__(self, world):
+        self.frames += 1
+        population = world.object_count["Critter"]
+        if not self.population_changed:
+            if self.initial_population == None:
+                self.initial_population = population
+            self.population_changed = population != self.initial_population
+
+        if not self.population_changed or self.frames <= self.warmup \
+               or self.frames % self.sample_period != 0:
+            return False
+
+        self.samples.append(population)
+        if len(self.samples) == self.samples.maxlen:
+            average = mean(self.samples)
+            self.steady = max(self.samples) - min(self.samples) <= self.tolerance*average
+        return self.steady
+
+def run_experiment(experiment):
+    """ Run one simulation. experiment is a tuple (run number, options from
+    the command line, list of (setting, value) overrides, random seed).
+    Returns the run's row of the results table, as a dict. """
+    (run, options, overrides, seed) = experiment
+
+    # Nothing is drawn, so the images are never needed
+    disable_loading()
+
+    config = Config(options.config_file, options.spec_file)
+    for (name, value) in overrides:
+        config.override(name, value)
+    config.override("random_seed", seed)
+
+    # Every run would export its graphs to the same files
+    config.override("enable_graphs", "0")
+
+    seed_random(config)
+    start_time = time.time()
+    world = World(None, config)
+
+    if options.steady_window > 0:
+        # Wait for the first critters to grow up and start reproducing
+        detector = SteadyStateDetector(options.steady_window, options.steady_tolerance,
+                                       config.maturity_age*config.framerate)
+    else:
+        detector = None
+    frames = world.run_headless(options.frames, detector)
+
+    if world.object_count["Critter"] == 0:
+        stop_reason = "extinct"
+    elif detector != None and detector.steady:
+        stop_reason = "steady"
+    else:
+        stop_reason = "max_frames"
+
+    stats = world.population_stats
+    result = {
+        "run": run,
+        "seed": seed,
+        "frames": frames,
+        "stop_reason": stop_reason,
+        "seconds": "{0:.2f}".format(time.time() - start_time),
+        "critters": stats.count,
+        "males": stats.gender_counts["m"],
+        "females": stats.gender_counts["f"],
+        "food": world.object_count["Food"],
+    }
+    result.update(overrides)
+    for trait in Agent.trait_names:
+        if stats.count > 0:
+            result[trait + "_average"] = stats.mean(trait)
+        else:
+            result[trait + "_average"] = ""
+    return result
+
+def parse_override(argument):
+    """ Parse a --set argument ("setting=value1,value2,...") into a
+    tuple (setting, list of values), checking that the values are valid. """
+    try:
+        (name, values) = argument.split("=", 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected setting=value1,value2,...")
+    name = name.strip()
+    values = [value.strip() for value in values.split(",")]
+
+    if name not in Config.setting_dict:
+        raise argparse.ArgumentTypeError("unknown config setting: {0}".format(name))
+    for value in values:
+        try:
+            Config.setting_dict[name](value)
+        except ValueError:
+            raise argparse.ArgumentTypeError("invalid value for '{0}': {1}".format(name, value))
+    return (name, values)
+
+def make_experiments(options):
+    """ Get the list of experiments to run (see run_experiment): one for
+    every combination of the overridden settings' values, with every seed. """
+    names = [name for (name, values) in options.overrides]
+    combinations = itertools.product(*[values for (name, values) in options.overrides])
+
+    experiments = []
+    for combination in combinations:
+        for seed in xrange(options.seeds):
+            experiments.append((len(experiments) + 1, options,
+                                zip(names, combination), str(seed)))
+    return experiments
+
+def write_results(filename, names, results):
+    """ Write the results table as CSV, one row per run in run order. """
+    columns = ["run", "seed"] + names + ["frames", "stop_reason", "seconds",
+               "critters", "males", "females", "food"] \
+              + [trait + "_average" for trait in Agent.trait_names]
+    with open(filename, "wb") as out_file:
+        writer = csv.DictWriter(out_file, columns)
+        writer.writerow(dict(zip(columns, columns)))
+        for result in sorted(results, key=lambda result: result["run"]):
+            writer.writerow(result)
+
+def parse_arguments(arguments):
+    parser = argparse.ArgumentParser(
+        description="Run headless simulations in parallel and tabulate the results.")
+    parser.add_argument("config_file", help="configuration file in setups/")
+    parser.add_argument("spec_file", help="world specification file in setups/")
+    parser.add_argument("frames", type=int, help="maximum number of frames for each run")
+    parser.add_argument("--set", dest="overrides", action="append", default=[],
+                        type=parse_override, metavar="SETTING=VALUE,...",
+                        help="try each of these values for a setting; give more than "
+                             "once to run every combination")
+    parser.add_argument("--seeds", type=int, default=1,
+                        help="run each combination with random seeds 0 to SEEDS-1 (default 1)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="number of simulations to run at once (default: one per CPU)")
+    parser.add_argument("--output", default="results.csv",
+                        help="file to write the results table to (default results.csv)")
+    parser.add_argument("--steady-window", type=int, default=0,
+                        help="stop a run once the population has stayed within "
+                             "--steady-tolerance of its mean for this many frames, "
+                             "after it has first changed and the first critters have "
+                             "matured (default 0: never)")
+    parser.add_argument("--steady-tolerance", type=float, default=0.05,
+                        help="fraction used by --steady-window (default 0.05)")
+    return parser.parse_args(arguments)
+
+if __name__ == '__main__':
+    options = parse_arguments(sys.argv[1:])
+
+    # Check the base configuration before starting any processes
+    try:
+        Config(options.config_file, options.spec_file, AssetCache("cache"))
+    except ConfigParseException as ex:
+        print ex
+        sys.exit(1)
+
+    experiments = make_experiments(options)
+    names = [name for (name, values) in options.overrides]
+    print "Running {0} simulations".format(len(experiments))
+
+    start_time = time.time()
+    pool = multiprocessing.Pool(options.processes)
+    results = []
+    try:
+        # Take the results as they finish, so slow runs don't hold up the
+        # progress report
+        for result in pool.imap_unordered(run_experiment, experiments):
+            results.append(result)
+            print "[{0}/{1}] Run {2} ({3}) stopped after {4} frames: {5}".format(
+                len(results), len(experiments), result["run"],
+                ", ".join("{0}={1}".format(name, result[name]) for name in names + ["seed"]),
+                result["frames"], result["stop_reason"])
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print "Interrupted; writing the results of the finished runs"
+    pool.join()
+
+    write_results(options.output, names, results)
+    print "Wrote {0} results to {1} in {2:.2f} seconds".format(
+        len(results), options.output, time.time() - start_time)
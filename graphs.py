@@ -49,7 +49,11 @@ def mean(iterable):
 class Graph(object):
     """ Abstract base class for graphs. Takes care of drawing the
     background and graph title, takes care of the update_period
-    parameter, and provides an output stream for the CSV export. """
+    parameter, and provides an output stream for the CSV export.
+
+    The parts of the graph which never change (the background and title,
+    plus whatever render_chrome adds) are drawn once to a surface, which
+    render then blits before drawing the foreground. """
     
     def __init__(self, x, y, width, height, title, update_period,
                  bg_color=Color(255, 255, 255), out_file=None):
@@ -70,6 +74,13 @@ class Graph(object):
         self.update_period = update_period
         self.counter = 0
 
+        # Whether the graph has changed since it was last rendered
+        self.changed = True
+
+        # Surface holding the unchanging parts of the graph; drawn by
+        # render_chrome the first time the graph is rendered
+        self.chrome = None
+
         # Create the output stream if necessary
         if out_file != None and out_file != "":
             self.out = open(out_file, "w")
@@ -81,6 +92,7 @@ class Graph(object):
         self.counter += 1
         if self.counter % self.update_period == 0:
             self.update_inner()
+            self.changed = True
 
     def update_inner(self):
         """ Called once per update_period. """
@@ -98,11 +110,33 @@ class Graph(object):
         if self.out != None:
             self.out.close()
     
+    def get_state(self):
+        """ Get whatever the graph needs to carry on from where it is (for
+        checkpoints), as a picklable object which set_state can restore. """
+        return {"counter": self.counter}
+
+    def set_state(self, state):
+        """ Restore the graph to a state returned by get_state. """
+        self.counter = state["counter"]
+        self.changed = True
+
     def render(self, screen):
         """ Draw the graph to the screen. """
-        screen.fill(self.bg_color, self.rect)
+        if self.chrome == None:
+            self.chrome = self.render_chrome()
+        screen.blit(self.chrome, self.rect)
         self.render_foreground(screen)
-        screen.blit(self.title_image, self.rect)
+        self.changed = False
+
+    def render_chrome(self):
+        """ Draw the parts of the graph which never change to a new Surface
+        the size of the graph, and return it. Subclasses can extend this to
+        add their own (such as axes); the Surface's (0, 0) is at the top-left
+        corner of self.rect. """
+        chrome = pygame.Surface(self.rect.size)
+        chrome.fill(self.bg_color)
+        chrome.blit(self.title_image, (0, 0))
+        return chrome
 
     def render_foreground(self, screen):
         """ Draw the foreground of the graph (i.e. all of the graph, but
@@ -142,6 +176,11 @@ class LineGraph(Graph):
         self.fg_color = fg_color
         self.scale_division = float(scale_division)
 
+        # TelemetrySink which each data point is also recorded to (under the
+        # name given by metric), if any; set by the World
+        self.telemetry = None
+        self.metric = title
+
         # Create a single surface which we draw the graph area to. Each time
         # we add a new data point, we scroll this surface one pixel to the left,
         # and fill in the rightmost edge with the new data point. This surface
@@ -170,31 +209,61 @@ class LineGraph(Graph):
                          (self.graph_area_rect.width-1, new_data_point_scaled))
 
         # Write the data point to the CSV file if necessary
-        self.write_to_output("{0},{1}\n".format(self.counter, new_point))
+        if self.out != None:
+            self.write_to_output("{0},{1}\n".format(self.counter, new_point))
+        if self.telemetry != None:
+            self.telemetry.record(self.metric, self.counter, new_point)
     
-    def render_foreground(self, screen):
-        screen.blit(self.graph_surface, self.graph_area_rect)
+    def get_state(self):
+        # The plotted data only exists as the pixels of graph_surface
+        state = Graph.get_state(self)
+        state["graph_size"] = self.graph_surface.get_size()
+        state["graph_surface"] = pygame.image.tostring(self.graph_surface, "RGB")
+        return state
+
+    def set_state(self, state):
+        Graph.set_state(self, state)
+
+        # The data can't be redrawn at a different size, so is left out
+        # if the graph has changed size
+        if state["graph_size"] == self.graph_surface.get_size():
+            saved_surface = pygame.image.fromstring(state["graph_surface"],
+                                                    state["graph_size"], "RGB")
+            self.graph_surface.blit(saved_surface, (0, 0))
+
+    def render_chrome(self):
+        chrome = Graph.render_chrome(self)
+
+        # The graph area, relative to the chrome surface
+        graph_area_rect = self.graph_area_rect.move(-self.rect.left, -self.rect.top)
 
         # Draw axes
-        pygame.draw.line(screen, (0, 0, 0),
-                         self.graph_area_rect.topleft, self.graph_area_rect.bottomleft)
-        pygame.draw.line(screen, (0, 0, 0),
-                         self.graph_area_rect.bottomleft, self.graph_area_rect.bottomright)
+        pygame.draw.line(chrome, (0, 0, 0),
+                         graph_area_rect.topleft, graph_area_rect.bottomleft)
+        pygame.draw.line(chrome, (0, 0, 0),
+                         graph_area_rect.bottomleft, graph_area_rect.bottomright)
 
         # Draw scale marks
         for y in float_xrange(0.0, self.high, self.scale_division):
-            scaled_y = self.graph_area_rect.bottom - int((1 - y/self.high) * self.graph_area_rect.height)
-            pygame.draw.line(screen, (0, 0, 0),
-                             (self.graph_area_rect.left, scaled_y),
-                             (self.graph_area_rect.left - 5, scaled_y))
+            scaled_y = graph_area_rect.bottom - int((1 - y/self.high) * graph_area_rect.height)
+            pygame.draw.line(chrome, (0, 0, 0),
+                             (graph_area_rect.left, scaled_y),
+                             (graph_area_rect.left - 5, scaled_y))
 
         # Draw text labels on the scale for 0 and high
-        screen.blit(self.zero_surface,
-                    (self.graph_area_rect.left - self.zero_surface.get_width() - 6,
-                     self.graph_area_rect.bottom - self.zero_surface.get_height() + 4))
-        screen.blit(self.high_surface,
-                    (self.graph_area_rect.left - self.high_surface.get_width() - 6,
-                     self.graph_area_rect.top))
+        chrome.blit(self.zero_surface,
+                    (graph_area_rect.left - self.zero_surface.get_width() - 6,
+                     graph_area_rect.bottom - self.zero_surface.get_height() + 4))
+        chrome.blit(self.high_surface,
+                    (graph_area_rect.left - self.high_surface.get_width() - 6,
+                     graph_area_rect.top))
+        return chrome
+
+    def render_foreground(self, screen):
+        # The y-axis runs down the leftmost column of the graph area, so
+        # leave that column of the chrome showing
+        screen.blit(self.graph_surface, self.graph_area_rect.move(1, 0),
+                    Rect(1, 0, self.graph_area_rect.width - 1, self.graph_area_rect.height))
             
 
 class PopulationGraph(LineGraph):
@@ -208,6 +277,7 @@ class PopulationGraph(LineGraph):
                            Color(200, 200, 200), Color(80, 80, 150), out_file)
         
         self.world = world
+        self.metric = "population"
 
     def update_inner(self):
         self.add_data_point(self.world.object_count["Critter"])
@@ -224,6 +294,7 @@ class FoodGraph(LineGraph):
                            Color(200, 200, 200), Color(80, 150, 80), out_file)
 
         self.world = world
+        self.metric = "food"
 
     def update_inner(self):
         self.add_data_point(self.world.object_count["Food"])
@@ -241,10 +312,9 @@ class AgentTraitGraph(LineGraph):
 
         self.trait = trait
         self.world = world
+        self.metric = "mean_" + trait
 
     def update_inner(self):
-        self.add_data_point(mean(obj.agent.traits[self.trait]
-                                 for obj in self.world.objects
-                                 if obj.get_type() == "Critter"))
+        self.add_data_point(self.world.population_stats.mean(self.trait))
 
     
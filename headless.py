@@ -0,0 +1,62 @@
+"""
+headless.py
+
+Runs the simulation without a window, without loading any images and
+without limiting the framerate, for when only the graph data is wanted
+(e.g. batch experiments on a server with no screen). Graphs are still
+updated, so set the <graphname>_export_path settings to collect the data,
+and the record_path setting to record the run for replay.py.
+
+Usage: python headless.py config_file world_spec_file [frames]
+
+If frames is left out, the simulation runs until all the critters die.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import sys
+import time
+
+#imports from our own files
+from main import *
+from recording import *
+
+if __name__ == '__main__':
+    # Parse the configuration and world specification (using the same
+    # cache as main.py)
+    try:
+        config = Config(sys.argv[1], sys.argv[2], AssetCache("cache"))
+        if len(sys.argv) > 3:
+            max_frames = int(sys.argv[3])
+        else:
+            max_frames = None
+    except ConfigParseException as ex:
+        print ex
+        sys.exit(1)
+    except (IndexError, ValueError):
+        # User left out a command-line parameter, or frames isn't a number
+        print "USAGE: python headless.py config_file world_spec_file [frames]"
+        sys.exit(1)
+
+    seed_random(config)
+
+    # The graphs still draw their titles with a font, but nothing else
+    # of Pygame's is needed
+    pygame.font.init()
+    disable_loading()
+
+    world = World(None, config)
+    if config.record_path != "":
+        world.recorder = Recorder(world, config.record_path, config.record_keyframe_interval)
+    start_time = time.time()
+    frames = world.run_headless(max_frames)
+
+    print "Simulated {0} frames in {1:.2f} seconds; {2} critters and {3} food left".format(
+        frames, time.time() - start_time,
+        world.object_count["Critter"], world.object_count["Food"])
+    # (An empty random_seed setting gets a random seed; this repeats the run)
+    print "Random seed: {0}".format(world.random_streams.seed)
@@ -5,17 +5,208 @@ Loads images and stores them in a single, localised location.
 This prevents multiple copies of the same image from being loaded
 unnecessarily.
 
-The first time a function from this module is called, the image is
-loaded and returned; on subsequent calls, a reference to that same image
-is returned.
-
-All graphics used in this program are open content and 
+Images are grouped into sprite sheets (see add_sheet). The first time
+any image on a sheet is asked for, the whole sheet is loaded and packed
+into one surface, converted once to the display's pixel format; the
+images returned are subsurfaces of it. On subsequent calls, references
+to those same images are returned. If an AssetCache is given to use_cache,
+the packed pixels are kept in it, so that later runs don't have to decode
+the PNG files again.
+
+All graphics used in this program are open content and
 were provided for by REFMAP(http://www.tekepon.net/fsm)
 """
 
 import pygame
-
-male_images = None
+from os import path
+
+# Set to False by disable_loading, for running without a display
+loading_enabled = True
+
+# AssetCache holding the packed sprite sheets, or None; set by use_cache
+asset_cache = None
+
+# Path of the source of this module; cached sheets depend on it, since
+# it defines how they are packed
+source_path = path.relpath(path.splitext(__file__)[0] + ".py")
+
+def disable_loading():
+    """ Stop images from being loaded; every getter returns None in place
+    of each image instead. Used when running without a display, since
+    converting images requires one. Must be called before any getter. """
+    global loading_enabled
+    loading_enabled = False
+
+def use_cache(cache):
+    """ Keep the packed sprite sheets in the given AssetCache, and load them
+    from it when they are up to date. Must be called before any getter. """
+    global asset_cache
+    asset_cache = cache
+
+# The asset registry.
+# Map from sheet name to (whether its images have per-pixel transparency,
+# list of the names of its images); image "name" is loaded from images/name.png
+sheets = {}
+
+# Map from image name to the name of the sheet it is on
+image_sheets = {}
+
+# Map from sheet name to the list of its images, for the sheets loaded so far
+loaded_sheets = {}
+
+def add_sheet(sheet, alpha, names):
+    """ Register a sprite sheet containing the named images. """
+    sheets[sheet] = (alpha, names)
+    for name in names:
+        image_sheets[name] = sheet
+
+def get_sheet(sheet):
+    """ Get the list of images on a sheet, loading it if necessary. """
+    if sheet not in loaded_sheets:
+        loaded_sheets[sheet] = load_sheet(sheet)
+    return loaded_sheets[sheet]
+
+def get_image(name):
+    """ Get a single image by name, loading its sheet if necessary. """
+    sheet = image_sheets[name]
+    return get_sheet(sheet)[sheets[sheet][1].index(name)]
+
+# Alignment of the images in each sheet's surface, in pixels
+atlas_alignment = 16
+
+def load_sheet(sheet):
+    """ Load the images on a sheet, packed side by side into a single surface
+    converted to the display's pixel format (keeping per-pixel transparency
+    if the sheet has it). Returns a list of subsurfaces, one per image. """
+    (alpha, names) = sheets[sheet]
+    if not loading_enabled:
+        return [None]*len(names)
+
+    (atlas, rects, colorkey) = pack_sheet(sheet)
+    if alpha:
+        atlas = atlas.convert_alpha()
+    else:
+        atlas = atlas.convert()
+
+    sprites = [atlas.subsurface(rect) for rect in rects]
+    if colorkey != None:
+        for surface in [atlas] + sprites:
+            surface.set_colorkey(colorkey)
+    return sprites
+
+def pack_sheet(sheet):
+    """ Pack the images on a sheet side by side into a single (unconverted)
+    surface. Returns a tuple (surface, rects, colorkey), where rects gives
+    the position of each image on the surface and colorkey is the sheet's
+    transparent colour key (or None). The result is taken from asset_cache
+    if possible, and stored in it otherwise. """
+    (alpha, names) = sheets[sheet]
+    filenames = ['images/' + name + '.png' for name in names]
+    pixel_format = "RGBA" if alpha else "RGB"
+    cache_name = "sheet_" + sheet
+
+    if asset_cache != None:
+        cached = asset_cache.get_raw(cache_name, filenames + [source_path])
+        if cached != None:
+            ((size, rects, colorkey), pixels) = cached
+            try:
+                atlas = pygame.image.frombuffer(pixels, size, pixel_format)
+            except TypeError:
+                # Python 2's mmap doesn't have the buffer interface Pygame
+                # wants, so the pixels have to be copied out of it
+                atlas = pygame.image.fromstring(pixels[:], size, pixel_format)
+            return (atlas, rects, colorkey)
+
+    images = [pygame.image.load(filename) for filename in filenames]
+
+    # Each image starts at a multiple of atlas_alignment pixels across, and
+    # so does each row of the atlas; blitting is much slower from unaligned rows
+    positions = []
+    width = 0
+    for image in images:
+        positions.append((width, 0))
+        width += -(-image.get_width()//atlas_alignment)*atlas_alignment
+    height = max(image.get_height() for image in images)
+
+    # Images without per-pixel transparency may have a transparent colour
+    # key instead; the images on a sheet are expected to share the same one
+    colorkey = None
+    if alpha:
+        atlas = pygame.Surface((width, height), pygame.SRCALPHA, 32)
+        atlas.fill((0, 0, 0, 0))
+    else:
+        atlas = pygame.Surface((width, height), 0, 32)
+        colorkey = images[0].get_colorkey()
+
+    rects = []
+    for (image, position) in zip(images, positions):
+        if not alpha:
+            # Copy the colour key pixels too, rather than skipping them
+            image.set_colorkey(None)
+        rects.append(tuple(atlas.blit(image, position)))
+
+    if asset_cache != None:
+        asset_cache.put_raw(cache_name, filenames + [source_path],
+                            ((width, height), rects, colorkey),
+                            pygame.image.tostring(atlas, pixel_format))
+    return (atlas, rects, colorkey)
+
+class LazySprites(object):
+    """ A nested list of sprite sheet names, which can be indexed like the
+    nested list of their images; each sheet is only loaded the first time it
+    is indexed. """
+
+    def __init__(self, sheet_names):
+        self.sheet_names = sheet_names
+        self.items = [None]*len(sheet_names)
+
+    def __len__(self):
+        return len(self.sheet_names)
+
+    def __getitem__(self, index):
+        item = self.items[index]
+        if item == None:
+            sheet_name = self.sheet_names[index]
+            if isinstance(sheet_name, list):
+                item = LazySprites(sheet_name)
+            else:
+                item = get_sheet(sheet_name)
+            self.items[index] = item
+        return item
+
+# The critter sprites; each life stage has a sheet per direction, holding
+# the animation frames
+critter_stages = {
+    "m": ["boy", "teen", "man", "grandpa"],
+    "f": ["girl", "teeng", "woman", "grandma"]
+}
+critter_directions = ["east", "south", "west", "north"]
+critter_frames = 2
+
+for stages in critter_stages.values():
+    for stage in stages:
+        for direction in critter_directions:
+            add_sheet(stage + "_" + direction, False,
+                      [stage + "_" + direction + str(frame + 1)
+                           for frame in xrange(critter_frames)])
+
+add_sheet("eagle", True, ["eagle1", "eagle2"])
+add_sheet("dove", True, ["dove1", "dove2"])
+add_sheet("tiles", False, ["tile_grass", "tile_daisies", "tile_dirt", "tile_hill",
+                           "tile_long_grass", "tile_pit", "tile_sand"])
+add_sheet("objects", True, ["bones", "goat", "heart2", "palm", "pine", "oak", "dead_tree",
+                            "fern", "pink_flowers", "yellow_flowers", "rocks", "stump"])
+
+critter_images = {}
+
+def get_critter_images(gender):
+    """ Get the sprites for a critter of the given gender ("m" or "f"),
+    in the format described in get_male_images. """
+    if gender not in critter_images:
+        critter_images[gender] = LazySprites(
+            [[stage + "_" + direction for direction in critter_directions]
+                 for stage in critter_stages[gender]])
+    return critter_images[gender]
 
 def get_male_images():
     """ Get the sprites for the male critter.
@@ -25,431 +216,80 @@ def get_male_images():
       (0=child, 1=teenager, 2=adult, 3=elder)
     * the second dimension (from 0 to 4) gives the direction the critter
       is facing (0=east, 1=south, 2=west, 3=north)
-    * the third dimension gives the animation frame. """
-
-    global male_images
-    
-    if male_images == None:
-        male_images = [
-            # child
-            [
-                # east
-                [
-                    pygame.image.load('images/boy_east1.png').convert(),
-                    pygame.image.load('images/boy_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/boy_south1.png').convert(),
-                    pygame.image.load('images/boy_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/boy_west1.png').convert(),
-                    pygame.image.load('images/boy_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/boy_north1.png').convert(),
-                    pygame.image.load('images/boy_north2.png').convert()
-                ]
-            ],
-            # teen
-            [
-                # east
-                [
-                    pygame.image.load('images/teen_east1.png').convert(),
-                    pygame.image.load('images/teen_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/teen_south1.png').convert(),
-                    pygame.image.load('images/teen_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/teen_west1.png').convert(),
-                    pygame.image.load('images/teen_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/teen_north1.png').convert(),
-                    pygame.image.load('images/teen_north2.png').convert()
-                ]
-            ],
-            # adult
-            [
-                # east
-                [
-                    pygame.image.load('images/man_east1.png').convert(),
-                    pygame.image.load('images/man_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/man_south1.png').convert(),
-                    pygame.image.load('images/man_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/man_west1.png').convert(),
-                    pygame.image.load('images/man_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/man_north1.png').convert(),
-                    pygame.image.load('images/man_north2.png').convert()
-                ]
-            ],
-            # elder
-            [
-                # east
-                [
-                    pygame.image.load('images/grandpa_east1.png').convert(),
-                    pygame.image.load('images/grandpa_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/grandpa_south1.png').convert(),
-                    pygame.image.load('images/grandpa_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/grandpa_west1.png').convert(),
-                    pygame.image.load('images/grandpa_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/grandpa_north1.png').convert(),
-                    pygame.image.load('images/grandpa_north2.png').convert()
-                ]
-            ]
-        ]
-        
-    return male_images
-
-female_images = None
+    * the third dimension gives the animation frame.
+
+    (The "list" is a LazySprites, which only loads the sprites for each
+    life stage and direction when they are first used.) """
+    return get_critter_images("m")
 
 def get_female_images():
     """ Get the sprites for the female critter. Return value
     is in the same format as get_male_images. """
-
-    global female_images
-    
-    if female_images == None:
-        female_images = [
-            # child
-            [
-                # east
-                [
-                    pygame.image.load('images/girl_east1.png').convert(),
-                    pygame.image.load('images/girl_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/girl_south1.png').convert(),
-                    pygame.image.load('images/girl_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/girl_west1.png').convert(),
-                    pygame.image.load('images/girl_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/girl_north1.png').convert(),
-                    pygame.image.load('images/girl_north2.png').convert()
-                ]
-            ],
-            # teen
-            [
-                # east
-                [
-                    pygame.image.load('images/teeng_east1.png').convert(),
-                    pygame.image.load('images/teeng_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/teeng_south1.png').convert(),
-                    pygame.image.load('images/teeng_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/teeng_west1.png').convert(),
-                    pygame.image.load('images/teeng_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/teeng_north1.png').convert(),
-                    pygame.image.load('images/teeng_north2.png').convert()
-                ]
-            ],
-            # adult
-            [
-                # east
-                [
-                    pygame.image.load('images/woman_east1.png').convert(),
-                    pygame.image.load('images/woman_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/woman_south1.png').convert(),
-                    pygame.image.load('images/woman_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/woman_west1.png').convert(),
-                    pygame.image.load('images/woman_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/woman_north1.png').convert(),
-                    pygame.image.load('images/woman_north2.png').convert()
-                ]
-            ],
-            # elder
-            [
-                # east
-                [
-                    pygame.image.load('images/grandma_east1.png').convert(),
-                    pygame.image.load('images/grandma_east2.png').convert()
-                ],
-                # south
-                [
-                    pygame.image.load('images/grandma_south1.png').convert(),
-                    pygame.image.load('images/grandma_south2.png').convert()
-                ],
-                # west
-                [
-                    pygame.image.load('images/grandma_west1.png').convert(),
-                    pygame.image.load('images/grandma_west2.png').convert()
-                ],
-                # north
-                [
-                    pygame.image.load('images/grandma_north1.png').convert(),
-                    pygame.image.load('images/grandma_north2.png').convert()
-                ]
-            ]
-        ]
-        
-    return female_images
-
-eagle = None
+    return get_critter_images("f")
 
 def get_eagle():
     """ Get the eagle sprites. Returns a list containing the
     animation frames. """
-    global eagle
-
-    if eagle == None:
-        eagle = [
-            pygame.image.load('images/eagle1.png').convert_alpha(),
-            pygame.image.load('images/eagle2.png').convert_alpha()
-        ]
-
-    return eagle
-
-dove = None
+    return get_sheet("eagle")
 
 def get_dove():
     """ Get the dove sprites. Returns a list containing the
     animation frames. """
-    global dove
-
-    if dove == None:
-        dove = [
-            pygame.image.load('images/dove1.png').convert_alpha(),
-            pygame.image.load('images/dove2.png').convert_alpha()
-        ]
-
-    return dove
-
-skeleton = None
+    return get_sheet("dove")
 
 def get_skeleton():
-    global skeleton
-
-    if skeleton == None:
-        skeleton = pygame.image.load('images/bones.png').convert_alpha()
-
-    return skeleton
-
-food_image = None
+    return get_image("bones")
 
 def get_food_image():
-    global food_image
-
-    if food_image == None:
-        food_image = pygame.image.load('images/goat.png').convert_alpha()
-
-    return food_image
-
-tile_grass = None
+    return get_image("goat")
 
 def get_tile_grass():
-    global tile_grass
-
-    if tile_grass == None:
-        tile_grass = pygame.image.load('images/tile_grass.png').convert()
-
-    return tile_grass
-
-tile_daisies = None
+    return get_image("tile_grass")
 
 def get_tile_daisies():
-    global tile_daisies
-
-    if tile_daisies == None:
-        tile_daisies = pygame.image.load('images/tile_daisies.png').convert()
-
-    return tile_daisies
-
-tile_dirt = None
+    return get_image("tile_daisies")
 
 def get_tile_dirt():
-    global tile_dirt
-
-    if tile_dirt == None:
-        tile_dirt = pygame.image.load('images/tile_dirt.png').convert()
-
-    return tile_dirt
-
-tile_hill = None
+    return get_image("tile_dirt")
 
 def get_tile_hill():
-    global tile_hill
-
-    if tile_hill == None:
-        tile_hill = pygame.image.load('images/tile_hill.png').convert()
-
-    return tile_hill
-
-tile_long_grass = None
+    return get_image("tile_hill")
 
 def get_tile_long_grass():
-    global tile_long_grass
-
-    if tile_long_grass == None:
-        tile_long_grass = pygame.image.load('images/tile_long_grass.png').convert()
-
-    return tile_long_grass
-
-tile_pit = None
+    return get_image("tile_long_grass")
 
 def get_tile_pit():
-    global tile_pit
-
-    if tile_pit == None:
-        tile_pit = pygame.image.load('images/tile_pit.png').convert()
-
-    return tile_pit
-
-tile_sand = None
+    return get_image("tile_pit")
 
 def get_tile_sand():
-    global tile_sand
-
-    if tile_sand == None:
-        tile_sand = pygame.image.load('images/tile_sand.png').convert()
-
-    return tile_sand
-
-palm = None
+    return get_image("tile_sand")
 
 def get_palm():
-    global palm
-
-    if palm == None:
-        palm = pygame.image.load('images/palm.png').convert_alpha()
-
-    return palm
-
-pine = None
+    return get_image("palm")
 
 def get_pine():
-    global pine
-
-    if pine == None:
-        pine = pygame.image.load('images/pine.png').convert_alpha()
-
-    return pine
-
-oak = None
+    return get_image("pine")
 
 def get_oak():
-    global oak
-
-    if oak == None:
-        oak = pygame.image.load('images/oak.png').convert_alpha()
-
-    return oak
-
-dead_tree = None
+    return get_image("oak")
 
 def get_dead_tree():
-    global dead_tree
-
-    if dead_tree == None:
-        dead_tree = pygame.image.load('images/dead_tree.png').convert_alpha()
-
-    return dead_tree
-
-heart = None
+    return get_image("dead_tree")
 
 def get_heart():
-    global heart
-
-    if heart == None:
-        heart = pygame.image.load('images/heart2.png').convert_alpha()
-
-    return heart
-
-fern = None
+    return get_image("heart2")
 
 def get_fern():
-    global fern
-
-    if fern == None:
-        fern = pygame.image.load('images/fern.png').convert_alpha()
-
-    return fern
-
-pink_flowers = None
+    return get_image("fern")
 
 def get_pink_flowers():
-    global pink_flowers
-
-    if pink_flowers == None:
-        pink_flowers = pygame.image.load('images/pink_flowers.png').convert_alpha()
-
-    return pink_flowers
-
-yellow_flowers = None
+    return get_image("pink_flowers")
 
 def get_yellow_flowers():
-    global yellow_flowers
-
-    if yellow_flowers == None:
-        yellow_flowers = pygame.image.load('images/yellow_flowers.png').convert_alpha()
-
-    return yellow_flowers
-
-rocks = None
+    return get_image("yellow_flowers")
 
 def get_rocks():
-    global rocks
-
-    if rocks == None:
-        rocks = pygame.image.load('images/rocks.png').convert_alpha()
-
-    return rocks
-
-stump = None
+    return get_image("rocks")
 
 def get_stump():
-    global stump
-
-    if stump == None:
-        stump = pygame.image.load('images/stump.png').convert_alpha()
-
-    return stump
-
+    return get_image("stump")
@@ -0,0 +1,108 @@
+"""
+layers.py
+
+Contains the SceneryLayer, which draws all the scenery onto the
+background once so that it doesn't have to be drawn every frame.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import pygame
+from pygame.locals import *
+
+from depth import *
+
+class SceneryLayer(object):
+    """ A copy of the World's background with all the scenery drawn on it,
+    so that a frame can start with one blit of the layer instead of drawing
+    the background and every tree, rock and flower separately.
+
+    The other objects are then drawn on top of the layer. That's only
+    correct where nothing they cover is in front of them, so wherever an
+    object overlaps scenery which should hide part of it (or a skeleton
+    overlaps any scenery, since skeletons go underneath everything), that
+    area is drawn again from scratch, in the proper order.
+
+    (The scenery images have soft, partly transparent edges, which don't come
+    out the same if they are drawn onto a transparent surface first; so the
+    layer includes the background, rather than being drawn over it.) """
+
+    def __init__(self, background, scenery):
+        """ Build the layer from the background Surface and the scenery
+        objects. The background may only cover part of the world; scenery
+        outside it is left out. """
+        self.background = background
+
+        # The scenery, back to front, with the sort keys and Rects of each
+        bounds = background.get_rect()
+        self.scenery = sorted([obj for obj in scenery if obj.get_rect().colliderect(bounds)],
+                              key=DepthOrder.sort_key)
+        self.keys = [(obj.y, obj.object_ID) for obj in self.scenery]
+        self.rects = [obj.get_rect() for obj in self.scenery]
+
+        self.surface = background.copy()
+        for obj in self.scenery:
+            obj.render(self.surface)
+
+    def render(self, screen, skeletons, objs, timer=None):
+        """ Draw the layer and the given objects on top of it to screen,
+        within the screen's current clipping area.
+        skeletons - the skeletons, which are drawn underneath everything
+        objs - the other objects (not scenery), back to front
+        timer - FrameTimer to time drawing the layer and the objects with, or None """
+        clip = screen.get_clip()
+
+        # Leave out anything entirely outside the clipping area, which can't be seen
+        (objs, obj_rects) = objects_in_rect(objs, clip)
+        (skeletons, skeleton_rects) = objects_in_rect(skeletons, clip)
+
+        screen.blit(self.surface, (0, 0))
+        if timer != None:
+            timer.lap("tile_blits")
+        for skeleton in skeletons:
+            skeleton.render(screen)
+        for obj in objs:
+            obj.render(screen)
+
+        # Find the areas where something has been drawn over scenery that
+        # should have been in front of it
+        hidden_rects = [rect for rect in skeleton_rects
+                            if rect.collidelist(self.rects) != -1]
+        for (obj, rect) in zip(objs, obj_rects):
+            key = (obj.y, obj.object_ID)
+            for hit in rect.collidelistall(self.rects):
+                if self.keys[hit] > key:
+                    hidden_rects.append(rect)
+                    break
+
+        # Draw those areas again, with everything in them in the right order
+        for rect in hidden_rects:
+            screen.set_clip(rect.clip(clip))
+            screen.blit(self.background, rect, rect)
+            for hit in rect.collidelistall(skeleton_rects):
+                skeletons[hit].render(screen)
+
+            in_rect = [self.scenery[hit] for hit in rect.collidelistall(self.rects)]
+            in_rect.extend(objs[hit] for hit in rect.collidelistall(obj_rects))
+            in_rect.sort(key=DepthOrder.sort_key)
+            for obj in in_rect:
+                obj.render(screen)
+        screen.set_clip(clip)
+        if timer != None:
+            timer.lap("object_blits")
+
+def objects_in_rect(objs, rect):
+    """ Find which of the objects overlap a Rect. Returns a tuple of
+    lists (objects, their Rects), in the same order as objs. """
+    found = []
+    rects = []
+    for obj in objs:
+        obj_rect = obj.get_rect()
+        if obj_rect.colliderect(rect):
+            found.append(obj)
+            rects.append(obj_rect)
+    return (found, rects)
@@ -16,6 +16,7 @@ were provided for by REFMAP(http://www.tekepon.net/fsm)
 from __future__ import division
 
 import os, sys
+import itertools
 from os import path
 import pygame
 from pygame.locals import *
@@ -26,23 +27,81 @@ random.seed()
 #imports from our own files
 from images import *
 from objects import *
+from agent import *
 from graphs import *
 from config import *
+from spatial import *
+from placement import *
+from store import *
+from rendering import *
+from depth import *
+from layers import *
+from cache import *
+from streams import *
+from population import *
+from telemetry import *
+from profiling import *
 
 class World(object):
     """ Stores all the simulation objects and runs the main
     simulation loop.
 
+    Publically accessible attributes (read-write):
+    self.steps_per_frame - Number of simulation steps run for every frame
+                           drawn by run.
+    self.recorder - Recorder (see recording.py) called after every frame, or None.
+
     Publically accessible attributes (read-only):
-    self.objects - List containing all Objects, excluding skeletons.
+    self.objects - ObjectStore containing all Objects, excluding scenery and
+                   skeletons.
+    self.scenery - ObjectStore containing the scenery, which never changes
+                   (so isn't updated each frame).
+    self.skeletons - ObjectStore containing the skeletons. Object IDs are unique
+                     across all three stores.
+    self.object_IDs - IDCounter handing out the object IDs for all three stores.
+    self.spatial_hash - SpatialHash containing the same Objects as self.objects
+                        and self.scenery, with cells the size of the critters'
+                        view distance.
+    self.food_index - SpatialHash containing only the Food in self.objects,
+                      with cells the size of collision_radius.
+    self.telemetry - TelemetrySink the graphs' data is written to, or None if
+                     telemetry_path is empty.
+    self.frame_timer - FrameTimer timing each phase of every frame, or None
+                       if frame_timing is off.
+    self.critter_state - CritterArrays holding the state of every critter, or
+                         None if critter_array_backend is off.
+    self.critter_class - Class to use for new critters (Critter or ArrayCritter).
+    self.random_streams - RandomStreams giving this World's random numbers,
+                          seeded from the random_seed setting.
+    self.random - The "world" random stream (a random.Random), used for
+                  where new critters and food go.
     self.object_count - Map from object type string ("Critter" or "Food")
                         to the current number of objects of that type.
-                        (Scenery is not tracked.)"""
+                        (Scenery is not tracked.)
+    self.population_stats - PopulationStatistics of the critters in self.objects.
+    self.dirty_renderer - DirtyRectRenderer used by render, or None if
+                          dirty_rect_rendering is off (or nothing has been
+                          rendered yet).
+    self.depth_order - DepthOrder containing the same Objects as self.objects,
+                       in the order render draws them, or None if nothing has
+                       been rendered yet.
+    self.scenery_layer - SceneryLayer used by render, or None if it needs
+                         (re)building.
+    self.view_rect - Rect of the world which render draws: all of it, or only
+                     the top-left corner if the screen is too small for it."""
+    
+    # Map from key to the steps_per_frame it selects
+    speed_keys = {K_1: 1, K_2: 10, K_3: 100, K_4: 1000}
     
-    def __init__(self, screen, config):
+    def __init__(self, screen, config, populate=True):
         """ Create a new World, given the Pygame Surface to draw to and
         the configuration settings (a Config object). Call run to actually
-        start the simulation. """
+        start the simulation, or run_headless to run it without drawing
+        anything (in which case screen may be None). If the screen is
+        smaller than the world (plus the graphs), only as much of the world
+        as fits on it is drawn.
+        populate - whether to add the initial critters and food; if False,
+                   the World only has the scenery (used to restore checkpoints) """
         
         # The simulation model has a toroidal topology (x and y co-ordinates
         # "wrap around"); we keep all x values in [0, width) and y values in
@@ -53,18 +112,104 @@ class World(object):
         
         self.screen = screen
         self.config = config
-        self.skeletons = []
-        self.objects = []
+
+        # All the World's randomness comes from these streams, so that runs
+        # with the same random_seed are the same
+        self.random_streams = RandomStreams(config.random_seed)
+        self.random = self.random_streams.stream("world")
+
+        self.object_IDs = IDCounter()
+        self.skeletons = ObjectStore(self.object_IDs)
+        self.scenery = ObjectStore(self.object_IDs)
+        self.objects = ObjectStore(self.object_IDs)
+        self.spatial_hash = SpatialHash(config.world_width, config.world_height,
+                                        config.critter_view_distance)
+        self.food_index = SpatialHash(config.world_width, config.world_height,
+                                      config.collision_radius)
+
+        # Objects passed to delete_later which are still in self.objects
+        self.pending_deletions = []
+
+        # Number of frames simulated so far
+        self.counter = 0
+        self.steps_per_frame = config.steps_per_frame
+
+        # Recorder (see recording.py) which records each frame, if any
+        self.recorder = None
+
+        # Finds clear positions for newly added objects
+        self.placer = Placer(config, self.random_streams.stream("placement"))
+
+        # With the array backend, critter state is kept in NumPy arrays
+        # (see arrays.py) and critters are ArrayCritters
+        if config.critter_array_backend:
+            self.critter_state = CritterArrays(config, Agent.trait_names,
+                                              self.random_streams.numpy_stream("behaviour"))
+            self.critter_class = ArrayCritter
+        else:
+            self.critter_state = None
+            self.critter_class = Critter
 
         # Map from object type string (return value from Object.get_type)
         # to number of objects of that type
         self.object_count = {"Critter": 0, "Food": 0}
+
+        # Statistics of the critters' traits, genders and life stages, kept
+        # up to date as critters are added and removed
+        self.population_stats = PopulationStatistics(config, Agent.trait_names,
+                                                     config.trait_histogram_bins)
+
+        # Set up by prepare_rendering, if it's wanted
+        self.dirty_renderer = None
+        self.depth_order = None
+        self.scenery_layer = None
+
+        # variables to help the eagle and dove only sometimes
+        # fly accross 
+        self.eagle_on = True
+        self.eagle_x = 0
+        self.eagle_y = 0.1*self.config.world_height # first y channel
+        self.eagle_start = 0
+        self.dove_on = True
+        self.dove_x = 0.1*self.config.world_width # first x channel
+        self.dove_y = 0
+        self.dove_start = 0
         
+        # Collects the graphs' data and writes it out in the background, if wanted
+        if config.telemetry_path != "":
+            self.telemetry = TelemetrySink(config.telemetry_path, config.telemetry_format)
+        else:
+            self.telemetry = None
+
+        # Times each phase of every frame, if wanted
+        if config.frame_timing:
+            self.frame_timer = FrameTimer(config.frame_timing_window,
+                                          config.frame_timing_export_path, self.telemetry)
+        else:
+            self.frame_timer = None
+
+        # The frame timing overlay (see render_timing_hud), and the number of
+        # frames timed when it was last drawn
+        self.timing_hud = None
+        self.timing_hud_frame = 0
+
+        # Only draw as much of the world as fits on the screen; the graph
+        # sidebar goes to the right of it
+        if screen != None:
+            view_width = screen.get_width()
+            if config.enable_graphs:
+                view_width -= config.graph_width
+            self.view_rect = Rect(0, 0, min(config.world_width, view_width),
+                                  min(config.world_height, screen.get_height()))
+        else:
+            self.view_rect = Rect(0, 0, config.world_width, config.world_height)
+        view_width = self.view_rect.width
+        view_height = self.view_rect.height
+
         # Initialise graphs
         self.graphs = []
         if config.enable_graphs:
-            self.sidebar_rect = Rect(self.config.world_width, 0,
-                                     self.config.graph_width, self.config.world_height)
+            self.sidebar_rect = Rect(view_width, 0, self.config.graph_width, view_height)
             self.sidebar_color = Color(200, 200, 200)
             
             num_graphs = 0
@@ -78,11 +223,11 @@ class World(object):
             # between the graphs.
             if num_graphs > 0:
                 padding = 5
-                vertical_space_per_graph = (config.world_height - (num_graphs+1)*padding)/num_graphs
+                vertical_space_per_graph = (view_height - (num_graphs+1)*padding)/num_graphs
                 current_y = padding
                 
                 if config.population_graph:
-                    self.graphs.append(PopulationGraph(self, config.world_width, current_y, config.graph_width,
+                    self.graphs.append(PopulationGraph(self, view_width, current_y, config.graph_width,
                                                        vertical_space_per_graph, config.population_graph_high,
                                                        config.population_graph_scale_division,
                                                        config.population_graph_update_period,
@@ -90,7 +235,7 @@ class World(object):
                     current_y += vertical_space_per_graph + padding
 
                 if config.food_graph:
-                    self.graphs.append(FoodGraph(self, config.world_width, current_y, config.graph_width,
+                    self.graphs.append(FoodGraph(self, view_width, current_y, config.graph_width,
                                                  vertical_space_per_graph, config.food_graph_high,
                                                  config.food_graph_scale_division,
                                                  config.food_graph_update_period,
@@ -99,244 +244,554 @@ class World(object):
 
                 if config.agent_move_speed_graph:
                     self.graphs.append(AgentTraitGraph(self, "agent_move_speed",
-                                                       config.world_width, current_y, config.graph_width,
+                                                       view_width, current_y, config.graph_width,
                                                        vertical_space_per_graph, "Average move speed vs Time",
                                                        config.agent_move_speed_graph_high,
                                                        config.agent_move_speed_graph_scale_division,
                                                        config.agent_move_speed_graph_update_period,
                                                        config.agent_move_speed_graph_export_path))
                     current_y += vertical_space_per_graph + padding
-                
+
+            for graph in self.graphs:
+                graph.telemetry = self.telemetry
         
         # Add scenery from the world specification to the list of objects
         for item in self.config.scenery:
             if item[0] == "palm":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_palm(), self.config.tree_horizontal_offset, 
                                     self.config.palm_vertical_offset))
             elif item[0] == "oak":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_oak(), self.config.tree_horizontal_offset, 
                                     self.config.tree_vertical_offset))
             elif item[0] == "dead_tree":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_dead_tree(), self.config.tree_horizontal_offset, 
                                     self.config.tree_vertical_offset))
             elif item[0] == "pine":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_pine(), self.config.tree_horizontal_offset, 
                                     self.config.tree_vertical_offset))
             elif item[0] == "fern":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_fern(), self.config.small_object_offset, 
                                     self.config.small_object_offset))
             elif item[0] == "rocks":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_rocks(), self.config.small_object_offset, 
                                     self.config.small_object_offset))
             elif item[0] == "stump":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_stump(), self.config.small_object_offset, 
                                     self.config.small_object_offset))
             elif item[0] == "yellow_flowers":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_yellow_flowers(), self.config.small_object_offset, 
                                     self.config.small_object_offset))
             elif item[0] == "pink_flowers":
-                self.objects.append(Scenery(self.config, self, 0, item[1], item[2], 
+                self.add_here(Scenery(self.config, self, 0, item[1], item[2], 
                                     get_pink_flowers(), self.config.small_object_offset, 
                                     self.config.small_object_offset))
 
-        # Create the initial critters and food
+        if populate:
+            self.populate()
+
+    def populate(self):
+        """ Add the initial critters and food. """
+        config = self.config
+
+        # Create the initial critters and food; place them all in one go,
+        # so that they are kept clear of the scenery and each other
+        new_objs = []
         for i in xrange(self.config.starting_males):
-            self.add(Critter(config, self, len(self.objects),
-                random.random()*self.config.world_width, random.random()
-                    *self.config.world_height, random.randint(0, 5), 
-                            random.randint(0, 5), 2*self.config.ageing_interval, get_male_images(), "m"))
+            new_objs.append(self.critter_class(config, self, 0,
+                self.random.random()*self.config.world_width, self.random.random()
+                    *self.config.world_height, self.random.randint(0, 5), 
+                            self.random.randint(0, 5), 2*self.config.ageing_interval, get_male_images(), "m"))
         
         for i in xrange(self.config.starting_females):
-            self.add(Critter(config, self, len(self.objects),
-                random.random()*self.config.world_width, random.random()
-                    *self.config.world_height, random.randint(0, 5), 
-                            random.randint(0, 5), 2*self.config.ageing_interval, get_female_images(), "f"))
+            new_objs.append(self.critter_class(config, self, 0,
+                self.random.random()*self.config.world_width, self.random.random()
+                    *self.config.world_height, self.random.randint(0, 5), 
+                            self.random.randint(0, 5), 2*self.config.ageing_interval, get_female_images(), "f"))
         
         for i in xrange(10):
-            self.add(Food(config, self, len(self.objects), random.random()*self.config.world_width,
-                random.random()*self.config.world_height, self.config.food_energy))
+            new_objs.append(Food(config, self, 0, self.random.random()*self.config.world_width,
+                self.random.random()*self.config.world_height, self.config.food_energy))
+
+        self.add_many(new_objs)
     
     def delete(self, obj):
         """ Remove an object (other than a skeleton) from the world. """
         obj.kill()
-        self.objects.remove(obj)
+        self.store_for(obj).remove(obj)
+        self.unindex_object(obj)
+
+    def delete_later(self, obj):
+        """ Remove an object (other than a skeleton) from the simulation
+        straight away, but leave it in self.objects until the next call to
+        flush_deletions. This is safe to call while iterating over self.objects,
+        since the store's order is only changed by flush_deletions. """
+        obj.kill()
+        self.unindex_object(obj)
+        self.pending_deletions.append(obj)
 
-        if obj.get_type() in self.object_count:
-            self.object_count[obj.get_type()] -= 1
+    def flush_deletions(self):
+        """ Remove every object passed to delete_later from self.objects.
+        Called once per frame. """
+        for obj in self.pending_deletions:
+            self.store_for(obj).remove(obj)
+        self.pending_deletions = []
 
     def add(self, new_obj):
         """ Add an object (other than a skeleton) to the world; if the
         new object is too close to an existing object, it will be placed
-        randomly onto the world. """
+        randomly onto the world (see Placer for details). """
         
         # make sure the food is not too close to scenery, this messes
         # with the collision avoidance
-        can_add = True
-        for obj in self.objects:
-            if new_obj.distance_sq(obj) < 1.5*self.config.scenery_avoidance_radius_sq:
-                new_obj.x += random.random()*self.config.world_width
-                new_obj.x %= self.config.world_width
-                new_obj.y += random.random()*self.config.world_height
-                new_obj.y %= self.config.world_height
-                self.add(new_obj)
-                return
-        self.objects.append(new_obj)
-        
-        if new_obj.get_type() in self.object_count:
-            self.object_count[new_obj.get_type()] += 1
+        self.placer.place(new_obj, self.spatial_hash)
+        self.add_here(new_obj)
+
+    def add_many(self, new_objs):
+        """ Add a batch of objects (other than skeletons) to the world, as
+        with add; the new objects are also kept apart from each other. Much
+        faster than calling add for each object when the batch is large. """
+        self.placer.place_many(new_objs, itertools.chain(self.objects, self.scenery))
+        for new_obj in new_objs:
+            self.add_here(new_obj)
          
-    def add_here(self, new_obj):
+    def add_here(self, new_obj, keep_ID=False):
         """ Add an object (other than a skeleton) to the world, without
-        repositioning it if it is too close to an existing object. """
-        self.objects.append(new_obj)
+        repositioning it if it is too close to an existing object.
+        keep_ID - if True, the object keeps its object_ID instead of being
+                  given a new one (see ObjectStore.add_with_ID) """
+        if keep_ID:
+            self.store_for(new_obj).add_with_ID(new_obj)
+        else:
+            self.store_for(new_obj).add(new_obj)
+        self.index_object(new_obj)
+
+    def store_for(self, obj):
+        """ Get the ObjectStore which holds (or would hold) an object
+        other than a skeleton. """
+        if obj.get_type() == "Scenery":
+            return self.scenery
+        return self.objects
+
+    def index_object(self, obj):
+        """ Add a newly added object to the spatial indices and the
+        object counts. """
+        self.spatial_hash.insert(obj)
+        if obj.get_type() == "Food":
+            self.food_index.insert(obj)
+
+        if obj.get_type() in self.object_count:
+            self.object_count[obj.get_type()] += 1
+            if obj.get_type() == "Critter":
+                self.population_stats.add(obj)
+        elif obj.get_type() == "Scenery":
+            self.scenery_layer = None
+
+        if self.dirty_renderer != None:
+            self.dirty_renderer.object_added(obj)
+        if self.depth_order != None:
+            self.depth_order.add(obj)
+
+    def unindex_object(self, obj):
+        """ Remove a deleted object from the spatial indices and the
+        object counts. """
+        self.spatial_hash.remove(obj)
+        if obj.get_type() == "Food":
+            self.food_index.remove(obj)
 
-        if new_obj.get_type() in self.object_count:
-            self.object_count[new_obj.get_type()] += 1
+        if obj.get_type() in self.object_count:
+            self.object_count[obj.get_type()] -= 1
+            if obj.get_type() == "Critter":
+                self.population_stats.remove(obj)
+        elif obj.get_type() == "Scenery":
+            self.scenery_layer = None
+
+        if self.dirty_renderer != None:
+            self.dirty_renderer.object_removed(obj)
+        if self.depth_order != None:
+            self.depth_order.remove(obj)
         
-    def add_skeleton(self, new_skeleton):
-        """ Add a skeleton to the world. """
-        self.skeletons.append(new_skeleton)
+    def add_skeleton(self, new_skeleton, keep_ID=False):
+        """ Add a skeleton to the world. keep_ID is as for add_here. """
+        if keep_ID:
+            self.skeletons.add_with_ID(new_skeleton)
+        else:
+            self.skeletons.add(new_skeleton)
+        if self.dirty_renderer != None:
+            self.dirty_renderer.object_added(new_skeleton)
         
     def delete_skeleton(self, skeleton):
         """ Remove a skeleton from the world. """
         self.skeletons.remove(skeleton)
+        if self.dirty_renderer != None:
+            self.dirty_renderer.object_removed(skeleton)
     
     def run(self):
-        """ Run the simulation. Only returns when the user closes
-        the Pygame window. """
-        counter = 0
-        
-        tiles = {    
-            "g" : get_tile_grass(),
-            "d" : get_tile_daisies(),
-            "h" : get_tile_hill(),
-            "l" : get_tile_long_grass(),
-            "p" : get_tile_pit(),
-            "s" : get_tile_sand(),
-            "i" : get_tile_dirt()
-        }
-        
-        # variables to help the eagle and dove only sometimes
-        # fly accross 
-        eagle_on = True
-        eagle_x = 0
-        eagle_y = 0.1*self.config.world_height # first y channel
-        eagle_start = 0
-        dove_on = True
-        dove_x = 0.1*self.config.world_width # first x channel
-        dove_y = 0
-        dove_start = 0        
+        """ Run the simulation in the Pygame window. Only returns when
+        the user closes the Pygame window.
+
+        The display is redrawn framerate times per second, and the simulation
+        is stepped steps_per_frame times between redraws; the keys in
+        World.speed_keys change steps_per_frame while running, and the
+        +/- keys double/halve it. """
+        self.prepare_rendering()
+        self.show_speed()
+
+        # A single clock, so that it can keep a steady framerate
+        # across frames
+        clock = pygame.time.Clock()
+        timer = self.frame_timer
 
         # Main simulation loop
         while True:
             
             # Keep a steady framerate
-            clock = pygame.time.Clock()
             clock.tick(self.config.framerate)
 
-            # Check if the user quitted
+            # Check if the user quitted or changed the speed
             for event in pygame.event.get():
                 if event.type == QUIT:
-                    # Allow the graphs to close their output streams
-                    # if necessary
-                    for graph in self.graphs:
-                        graph.finish()
+                    self.finish()
                     return
-
-            # Update the simulation
-            # ---------------------
+                elif event.type == KEYDOWN:
+                    self.change_speed(event.key)
+            if timer != None:
+                timer.lap("waiting")
+
+            for i in xrange(self.steps_per_frame):
+                self.step()
+            changed_rects = self.render()
             
-            # Update each object; Iterate over a copy of the object list
-            # since modifying a list while iterating over it is verboten
-            for obj in self.objects[:]:
-                obj.update()
-
-            for obj in self.skeletons[:]:
-                obj.update()
-
-            # Maybe spawn some food
-            if counter % self.config.food_spawn_period == 0:
-                self.add(Food(config, self, 0, random.random()*self.config.world_width,
-                              random.random()*self.config.world_height, self.config.food_energy))
-
-            # Update the graphs
-            for graph in self.graphs:
-                graph.update()
-
-            # Render the simulation
-            # ---------------------
+            if changed_rects == None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(changed_rects)
+            if timer != None:
+                timer.lap("display_flip")
+                timer.end_frame(self.counter)
+
+    def change_speed(self, key):
+        """ Change steps_per_frame according to the key the user pressed
+        (if it's one of the speed keys). """
+        if key in World.speed_keys:
+            self.steps_per_frame = World.speed_keys[key]
+        elif key in (K_PLUS, K_EQUALS, K_KP_PLUS):
+            self.steps_per_frame *= 2
+        elif key in (K_MINUS, K_KP_MINUS):
+            self.steps_per_frame = max(1, self.steps_per_frame//2)
+        else:
+            return
+        self.show_speed()
+
+    def show_speed(self):
+        """ Show the current simulation speed in the window title. """
+        pygame.display.set_caption("Critters ({0}x speed)".format(self.steps_per_frame))
+
+    def run_headless(self, max_frames=None, should_stop=None):
+        """ Run the simulation without drawing anything or waiting between
+        frames, until max_frames frames have been simulated (if given) or all
+        the critters have died. The graphs are still updated, so their data
+        is still exported. Returns the number of frames simulated.
+        should_stop - optional function which is called with the World after
+                      every frame; the run also ends when it returns True """
+        frames = 0
+        while (max_frames == None or frames < max_frames) \
+                and self.object_count["Critter"] > 0:
+            self.step()
+            frames += 1
+            if self.frame_timer != None:
+                self.frame_timer.end_frame(self.counter)
+            if should_stop != None and should_stop(self):
+                break
+
+        self.finish()
+        return frames
+
+    def finish(self):
+        """ Called when the simulation ends. """
+        # Allow the graphs to close their output streams
+        # if necessary
+        for graph in self.graphs:
+            graph.finish()
+        if self.frame_timer != None:
+            self.frame_timer.finish()
+        if self.telemetry != None:
+            self.telemetry.close()
+        if self.recorder != None:
+            self.recorder.finish()
+
+    def step(self):
+        """ Update the simulation by one frame. """
+        # With frame_timing on, the end of each phase is marked with a lap
+        timer = self.frame_timer
             
-            # Sort the objects in order of y-coordinates so that they are
-            # rendered in the correct order: If A is behind B, we have render
-            # A first so that B appears in front.
-            self.objects.sort(key = lambda obj: obj.y)
-
-            # Draw the tiles
-            for x in xrange(self.config.cols):
-                for y in xrange(self.config.rows):
-                       self.screen.blit(tiles[self.config.tile_spec[x][y]], 
-                                        (x*self.config.tile_size, y*self.config.tile_size))
-
-            # Draw the objects; draw all the skeletons first so they appear
-            # underneath all the other objects.
-            for skeleton in self.skeletons:
-                skeleton.render(self.screen)
-
-            for obj in self.objects:
-                obj.render(self.screen)
-            
-            # Update and render the eagle and dove
-            # Since we draw these after all the other objects, they appear
-            # on top.
-            frame_choice = int(floor((counter / self.config.framerate)*5) % 2)
-            if(eagle_on):
-                if eagle_x > self.config.world_width:
-                    eagle_on = False   
-                eagle_x = (counter - eagle_start)
-                screen.blit(get_eagle()[frame_choice], (eagle_x, eagle_y))
-            if (not eagle_on) and \
-                random.randint(0, 2*self.config.framerate - 1) == \
-                (counter % 2*self.config.framerate):
-                eagle_on = True
-                eagle_x = 0
-                eagle_start = counter
-                eagle_y = (random.randint(1, 9)/10)*self.config.world_height
-            if(dove_on):
-                if dove_y < 0:
-                    dove_on = False   
-                dove_y = (self.config.world_height - (counter - dove_start))
-                screen.blit(get_dove()[frame_choice], (dove_x, dove_y))
-            if (not dove_on) and \
-                random.randint(0, 2*self.config.framerate - 1) == \
-                (counter % 2*self.config.framerate):
-                dove_on = True
-                dove_y = 0
-                dove_start = counter
-                dove_x = (random.randint(1, 9)/10)*self.config.world_width
-
-            # Draw the graph sidebar
-            if self.config.enable_graphs:
+        # With the array backend, work out what every critter can
+        # see and what it will do in one go
+        if self.critter_state != None:
+            self.critter_state.perceive(itertools.chain(self.objects, self.scenery))
+            if timer != None:
+                timer.lap("perception")
+            actions = compute_next_actions(self.config, self.critter_state)
+            if timer != None:
+                timer.lap("decisions")
+
+        # Update each object (the scenery never changes, so it's left out);
+        # Iterate over a copy of the object list since modifying a list while
+        # iterating over it is verboten
+        for obj in self.objects[:]:
+            obj.update(timer)
+
+        # With the array backend, now actually carry out the actions
+        if self.critter_state != None:
+            self.critter_state.step(*actions, timer=timer)
+
+        # Actually remove any food that was eaten during the updates
+        self.flush_deletions()
+        if timer != None:
+            timer.lap("interaction")
+
+        for obj in self.skeletons[:]:
+            obj.update()
+        if timer != None:
+            timer.lap("skeletons")
+
+        # Maybe spawn some food
+        if self.counter % self.config.food_spawn_period == 0:
+            self.add(Food(self.config, self, 0, self.random.random()*self.config.world_width,
+                          self.random.random()*self.config.world_height, self.config.food_energy))
+        if timer != None:
+            timer.lap("food_spawning")
+
+        # Update the graphs
+        for graph in self.graphs:
+            graph.update()
+        if timer != None:
+            timer.lap("graph_updates")
+
+        self.counter += 1
+
+        if self.recorder != None:
+            self.recorder.record_frame()
+            if timer != None:
+                timer.lap("recording")
+
+    def prepare_rendering(self):
+        """ Load the images needed by render. Must be called before the
+        first call to render. """
+        self.tiles = {    
+            "g" : get_tile_grass(),
+            "d" : get_tile_daisies(),
+            "h" : get_tile_hill(),
+            "l" : get_tile_long_grass(),
+            "p" : get_tile_pit(),
+            "s" : get_tile_sand(),
+            "i" : get_tile_dirt()
+        }
+        self.build_background()
+
+        # Keeps the objects in drawing order from frame to frame
+        self.depth_order = DepthOrder(self.objects)
+
+        # The sidebar is drawn in full by the first call to render
+        self.sidebar_drawn = False
+
+        # With dirty_rect_rendering, only redraw what changes each frame
+        if self.config.dirty_rect_rendering:
+            self.dirty_renderer = DirtyRectRenderer(self, self.screen)
+
+    def build_background(self):
+        """ Draw all the tiles in view once onto a background surface, which
+        render then draws with a single blit. Keep the version of the world
+        specification it was built from, so we can tell if it needs rebuilding. """
+        self.background = pygame.Surface(self.view_rect.size).convert()
+        tile_size = self.config.tile_size
+        cols = min(self.config.cols, int(ceil(self.view_rect.width/tile_size)))
+        rows = min(self.config.rows, int(ceil(self.view_rect.height/tile_size)))
+        for x in xrange(cols):
+            for y in xrange(rows):
+                   self.background.blit(self.tiles[self.config.tile_spec[x][y]], 
+                                        (x*tile_size, y*tile_size))
+        self.background_version = self.config.world_spec_version
+
+    def render(self):
+        """ Draw the simulation to the screen (without updating the display).
+        Returns a list of the Rects of the screen which have changed, or None
+        if all of it may have changed. """
+        timer = self.frame_timer
+        bird_sprites = self.update_birds()
+        if timer != None:
+            timer.lap("birds")
+
+        # The tiles are all on the background surface
+        if self.config.world_spec_version != self.background_version:
+            self.build_background()
+            self.scenery_layer = None
+            if self.dirty_renderer != None:
+                self.dirty_renderer.full_redraw = True
+
+        if self.dirty_renderer != None:
+            changed_rects = self.dirty_renderer.render(bird_sprites, timer)
+        else:
+            changed_rects = None
+
+            # The objects need to be rendered in order of y-coordinates: If A
+            # is behind B, we have render A first so that B appears in front.
+            # Only the critters can have moved out of order.
+            self.depth_order.sort_moving()
+            if timer != None:
+                timer.lap("sorting")
+
+            # Draw the tiles and scenery, which are all on the scenery layer,
+            # then the other objects; the skeletons go underneath all the
+            # other objects. Sprites near the right edge would otherwise
+            # spill into the graph sidebar.
+            self.screen.set_clip(self.view_rect)
+            if self.scenery_layer == None:
+                self.scenery_layer = SceneryLayer(self.background, self.scenery)
+            self.scenery_layer.render(self.screen, self.skeletons, self.depth_order, timer)
+
+            # Since we draw the eagle and dove after all the other
+            # objects, they appear on top.
+            for (image, position) in bird_sprites:
+                self.screen.blit(image, position)
+            self.screen.set_clip(None)
+            if timer != None:
+                timer.lap("object_blits")
+
+        # Draw the graph sidebar. Nothing else draws over it, so after the
+        # first time, only the graphs which have changed are drawn again.
+        if self.config.enable_graphs:
+            if not self.sidebar_drawn:
                 self.screen.fill(self.sidebar_color, self.sidebar_rect)
                 for graph in self.graphs:
                     graph.render(self.screen)
-            
-            counter += 1    
-            
-            pygame.display.flip()
+                self.sidebar_drawn = True
+                if changed_rects != None:
+                    changed_rects.append(self.sidebar_rect)
+            else:
+                for graph in self.graphs:
+                    if graph.changed:
+                        graph.render(self.screen)
+                        if changed_rects != None:
+                            changed_rects.append(graph.rect)
+            if timer != None:
+                timer.lap("graph_drawing")
+
+        if timer != None and self.config.frame_timing_hud:
+            self.render_timing_hud(changed_rects)
+            timer.lap("hud")
+
+        return changed_rects
+
+    def render_timing_hud(self, changed_rects):
+        """ Draw the frame timing overlay (a table of the frame_timer's summary)
+        in the top-left corner of the world, and add it to changed_rects (if
+        not None). The table is only updated twice a second. """
+        timer = self.frame_timer
+        if self.timing_hud == None or \
+                timer.frames - self.timing_hud_frame >= max(1, self.config.framerate//2):
+            self.timing_hud_frame = timer.frames
+            font = get_text_font()
+            rows = [["ms", "mean"] + ["p{0}".format(percentile)
+                                      for percentile in FrameTimer.percentiles]]
+            rows.extend([row[0]] + ["{0:.2f}".format(value) for value in row[1:]]
+                        for row in timer.summary())
+            cells = [[font.render(cell, True, Color(0, 0, 0)) for cell in row] for row in rows]
+
+            # The phase names are left-aligned and the times right-aligned
+            # in columns
+            padding = 4
+            column_widths = [max(row[column].get_width() for row in cells)
+                             for column in xrange(len(cells[0]))]
+            line_height = font.get_linesize()
+            hud = pygame.Surface((sum(column_widths) + padding*(len(column_widths) + 1),
+                                  line_height*len(cells) + 2*padding))
+            hud.fill(Color(255, 255, 255))
+            for (line, row) in enumerate(cells):
+                x = padding
+                for (column, cell) in enumerate(row):
+                    if column == 0:
+                        hud.blit(cell, (x, padding + line*line_height))
+                    else:
+                        hud.blit(cell, (x + column_widths[column] - cell.get_width(),
+                                        padding + line*line_height))
+                    x += column_widths[column] + padding
+
+            # The dirty rect renderer doesn't know the overlay was there, so
+            # if the new one doesn't cover the old one, redraw everything
+            if self.timing_hud != None and self.dirty_renderer != None \
+                    and hud.get_size() != self.timing_hud.get_size():
+                self.dirty_renderer.full_redraw = True
+            self.timing_hud = hud
+
+        self.screen.set_clip(self.view_rect)
+        hud_rect = self.screen.blit(self.timing_hud, (5, 5))
+        self.screen.set_clip(None)
+        if changed_rects != None:
+            changed_rects.append(hud_rect)
+
+    def update_birds(self):
+        """ Move the eagle and dove, which only sometimes fly across. Returns
+        a list of (image, position) pairs giving the sprites to draw for them. """
+        counter = self.counter
+        bird_sprites = []
+
+        # The birds have their own stream, so drawing them (or not) doesn't
+        # change the simulation
+        birds_random = self.random_streams.stream("birds")
+
+        frame_choice = int(floor((counter / self.config.framerate)*5) % 2)
+        if(self.eagle_on):
+            if self.eagle_x > self.config.world_width:
+                self.eagle_on = False   
+            self.eagle_x = (counter - self.eagle_start)
+            bird_sprites.append((get_eagle()[frame_choice], (self.eagle_x, self.eagle_y)))
+        if (not self.eagle_on) and \
+            birds_random.randint(0, 2*self.config.framerate - 1) == \
+            (counter % 2*self.config.framerate):
+            self.eagle_on = True
+            self.eagle_x = 0
+            self.eagle_start = counter
+            self.eagle_y = (birds_random.randint(1, 9)/10)*self.config.world_height
+        if(self.dove_on):
+            if self.dove_y < 0:
+                self.dove_on = False   
+            self.dove_y = (self.config.world_height - (counter - self.dove_start))
+            bird_sprites.append((get_dove()[frame_choice], (self.dove_x, self.dove_y)))
+        if (not self.dove_on) and \
+            birds_random.randint(0, 2*self.config.framerate - 1) == \
+            (counter % 2*self.config.framerate):
+            self.dove_on = True
+            self.dove_y = 0
+            self.dove_start = counter
+            self.dove_x = (birds_random.randint(1, 9)/10)*self.config.world_width
+
+        return bird_sprites
+
+
+def seed_random(config):
+    """ Seed the random module's global generator from the random_seed setting.
+    (The World has its own random streams, seeded from the same setting; see
+    RandomStreams.) """
+    if config.random_seed == "":
+        random.seed() # using the OS-specific randomness source
+    else:
+        random.seed(seed_from_string(config.random_seed))
             
 
 if __name__ == '__main__':
-    # Parse the configuration and world specification
+    # Parse the configuration and world specification; the parsed files,
+    # and the decoded images, are kept in the cache directory for next time
+    cache = AssetCache("cache")
     try:
-        config = Config(sys.argv[1], sys.argv[2])
+        config = Config(sys.argv[1], sys.argv[2], cache)
     except ConfigParseException as ex:
         print ex
         sys.exit(1)
@@ -346,14 +801,12 @@ if __name__ == '__main__':
         sys.exit(1)
 
     # Seed the random number generator
-    if config.random_seed == "":
-        random.seed() # using the OS-specific randomness source
-    else:
-        random.seed(hash(config.random_seed))
+    seed_random(config)
 
     # Initialise the Pygame library
     pygame.init()
     pygame.font.init()
+    use_cache(cache)
 
     # Create the Pygame window to draw onto
     if config.enable_graphs:
@@ -362,5 +815,10 @@ if __name__ == '__main__':
     else:
         screen = pygame.display.set_mode((config.world_width, config.world_height))
 
-    # Run the simulation
-    World(screen, config).run()
+    # Run the simulation, recording it if wanted (recording.py imports this
+    # module, so it can't be imported at the top)
+    world = World(screen, config)
+    if config.record_path != "":
+        from recording import Recorder
+        world.recorder = Recorder(world, config.record_path, config.record_keyframe_interval)
+    world.run()
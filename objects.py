@@ -12,7 +12,7 @@ were provided for by REFMAP(http://www.tekepon.net/fsm)
 
 from images import *
 from agent import *
-import random
+from arrays import *
 
 class Object(object):
     """ Abstract base class for simulation objects.
@@ -20,7 +20,9 @@ class Object(object):
     In addition to overriding show, kill and update, all Objects
     must have the following attributes:
     x, y - current simulation co-ordinates of the object
-    world - reference to the containing World"""
+    world - reference to the containing World
+    object_ID - ID of the object, unique within its World and never reused
+                (assigned by the World's ObjectStore when the object is added)"""
 
     def __init__(self):
         raise NotImplementedError("Override in your subclass")
@@ -29,9 +31,11 @@ class Object(object):
         """ Called when the object is destroyed. """
         pass
 
-    def update(self):
+    def update(self, timer=None):
         """ Called once every simulation step, to update the
-        object's simulation model. """
+        object's simulation model.
+        timer - the World's FrameTimer, to lap at the end of each phase of
+                the update, or None """
         pass
 
     def render(self, screen):
@@ -39,6 +43,11 @@ class Object(object):
         object to the screen. """
         pass
 
+    def get_rect(self):
+        """ Return the Rect of the screen area which render would
+        currently draw over. """
+        raise NotImplementedError("Override in your subclass")
+
     def distance_sq(self, other):
         """ Find the square of the distance between this Object and
         another Object. """
@@ -65,7 +74,8 @@ class Food(Object):
     
     def __init__(self, config, world, object_ID, x, y, contained_energy):
         """ Create a food item at the given position containing
-        the given amount of energy. (object_ID is not used)"""
+        the given amount of energy. (object_ID is replaced with a stable
+        ID by the World when the food is added to it)"""
         self.config = config
         self.world = world
         self.object_ID = object_ID
@@ -78,6 +88,10 @@ class Food(Object):
         screen.blit(self.food_image, (self.x - self.config.food_horizontal_offset,
                                       self.y - self.config.food_vertical_offset))
 
+    def get_rect(self):
+        return self.food_image.get_rect(topleft=(self.x - self.config.food_horizontal_offset,
+                                                 self.y - self.config.food_vertical_offset))
+
     def get_type(self):
         return "Food"
 
@@ -93,7 +107,8 @@ class Critter(Object):
     def __init__(self, config, world, object_ID, x, y, direction,
                  counter_offset, age, images, gender, parent1=None, parent2=None):
         """ Create a new Critter.
-        object_ID - not used
+        object_ID - replaced with a stable ID by the World when the critter
+                    is added to it
         x, y, direction - initial position and direction of the critter
         counter_offset - allows you to start the critter's walking animation
                          in a different position, preventing the initial critters
@@ -113,7 +128,7 @@ class Critter(Object):
         self.y = y
         self.direction = direction
         self.energy = self.config.initial_energy
-        self.agent = Agent(self.config, parent1, parent2)
+        self.agent = Agent(self.config, world.random_streams, parent1, parent2)
         self.images = images
         self.heart_image = get_heart()
         self.iteration_counter = counter_offset # counter used for animations and aging
@@ -121,46 +136,38 @@ class Critter(Object):
         self.heart_countdown = 0
         self.gender = gender
 
-    def update(self):
-        # Find all objects close enough to be visible to the agent;
-        # tag each along with its delta-x and delta-y values relative
-        # to this object.
-        visible_objects = []
-        for obj in self.world.objects:
-            if obj != self:
-                # There's two different ways to get from self.x to obj.x:
-                # directly, or around the left/right edge. We calculate
-                # both of these and get two possible "delta x" values
-                # Example: width=100, self.x=40, obj.x=80. Then
-                # dxDirect = +40 (40 units from left to right)
-                # and dxAround = -60 (60 units from right to left)
-                dxDirect = obj.x - self.x
-                if obj.x >= self.x:
-                    dxAround = dxDirect - self.config.world_width
-                else:
-                    dxAround = dxDirect + self.config.world_width
-
-                # Take the shorter one, i.e. the one with smaller
-                # absolute value
-                dx = min((dxDirect, dxAround), key = abs)
-                
-                # And the same with the y values
-                dyDirect = obj.y - self.y
-                if obj.y >= self.y:
-                    dyAround = dyDirect - self.config.world_height
-                else:
-                    dyAround = dyDirect + self.config.world_height
-
-                dy = min((dyDirect, dyAround), key = abs)
-
-                if dx**2 + dy**2 < self.config.critter_view_distance_sq:
-                    visible_objects.append((obj, dx, dy))
+    def update(self, timer=None):
+        visible_objects = self.perceive()
+        if timer != None:
+            timer.lap("perception")
 
         # Give the list of visible objects to the agent, and ask it what to do
         (turn_angle, move_distance, reproduce) = \
             self.agent.compute_next_action(self, visible_objects)
-
-        # Move according to the agent's instructions
+        if timer != None:
+            timer.lap("decisions")
+
+        self.move(turn_angle, move_distance)
+        if timer != None:
+            timer.lap("movement")
+        self.interact(reproduce)
+        if timer != None:
+            timer.lap("interaction")
+        self.decay()
+        if timer != None:
+            timer.lap("decay")
+
+    def perceive(self):
+        """ Find all objects close enough to be visible to the agent;
+        tag each along with its delta-x and delta-y values relative
+        to this object. Returns a list of (obj, dx, dy) triples. """
+        # The spatial hash takes care of the world wrapping around,
+        # and only looks at objects in nearby cells.
+        return self.world.spatial_hash.query(self.x, self.y,
+                            self.config.critter_view_distance_sq, self)
+
+    def move(self, turn_angle, move_distance):
+        """ Move according to the agent's instructions. """
         if move_distance > self.config.critter_max_move_speed:
             move_distance = self.config.critter_max_move_speed
         self.direction += turn_angle
@@ -176,7 +183,12 @@ class Critter(Object):
         while self.y >= self.config.world_height: self.y -= self.config.world_height
 
         self.direction %= 2*pi
+        self.world.spatial_hash.move(self)
 
+    def interact(self, reproduce):
+        """ Reproduce with the target chosen by the agent (if any), and eat
+        any food we're on top of. Called after moving. """
+        
         # Reproduce if the agent told us to, and the provided reproduction target
         # is suitable
         if reproduce and reproduce.get_type() == "Critter" \
@@ -189,14 +201,14 @@ class Critter(Object):
             reproduce.heart_countdown = self.config.heart_time
 
             # Create a child; flip a coin to decide on the child's gender
-            if random.randint(0, 1) == 1:
-                child = Critter(self.config, self.world, 0,
+            if self.world.random_streams.stream("genetics").randint(0, 1) == 1:
+                child = self.world.critter_class(self.config, self.world, 0,
                                 self.x, self.y,
                                 self.direction + pi, 0, 0,
                                 get_male_images(), "m",
                                 self.agent, reproduce.agent)
             else:
-                child = Critter(self.config, self.world, 0,
+                child = self.world.critter_class(self.config, self.world, 0,
                                 self.x, self.y,
                                 self.direction + pi, 0, 0,
                                 get_female_images(), "f",
@@ -210,22 +222,18 @@ class Critter(Object):
             self.energy -= self.config.reproduction_cost
 
         # Eat food if we are on top of it. This is automatic and does not need
-        # to be initiated by the agent.
-        for obj in self.world.objects:
-            if isinstance(obj, Food):
-                if self.distance_sq(obj) < self.config.collision_radius_sq:
-                    self.world.delete(obj)
-                    self.energy += obj.energy
-
-        # Energy decay + death
+        # to be initiated by the agent. The food is only removed from the
+        # list of objects at the end of the frame.
+        for (food, dx, dy) in self.world.food_index.query(self.x, self.y,
+                                                          self.config.collision_radius_sq):
+            self.world.delete_later(food)
+            self.energy += food.energy
+
+    def decay(self):
+        """ Lose energy (dying if there's none left), and age. """
         self.energy -= self.config.critter_energy_decay_rate
         if self.energy <= 0:
-            self.world.add_skeleton(Skeleton(self.config, self.world,
-                                                 0, self.x, self.y, 
-                                   get_skeleton(), 
-                                   self.config.skeleton_horizontal_offset, 
-                                   self.config.skeleton_vertical_offset))
-            self.world.delete(self)
+            self.die()
 
         # update the counter
         self.iteration_counter += 1
@@ -233,34 +241,130 @@ class Critter(Object):
         if self.iteration_counter % self.config.framerate == 0:
             self.heart_countdown -= 1
             self.age += 1
+            if self.age % self.config.ageing_interval == 0:
+                self.world.population_stats.update_life_stage(self)
+
+    def die(self):
+        """ Leave a skeleton behind and remove this critter from the world. """
+        self.world.add_skeleton(Skeleton(self.config, self.world,
+                                             0, self.x, self.y, 
+                               get_skeleton(), 
+                               self.config.skeleton_horizontal_offset, 
+                               self.config.skeleton_vertical_offset))
+        self.world.delete(self)
 
     def render(self, screen):
+        for (image, position) in self.get_sprites():
+            screen.blit(image, position)
+
+    def get_rect(self):
+        sprites = self.get_sprites()
+        rect = sprites[0][0].get_rect(topleft=sprites[0][1])
+        for (image, position) in sprites[1:]:
+            rect.union_ip(image.get_rect(topleft=position))
+        return rect
+
+    def get_sprites(self):
+        """ Get the images to draw for this critter in its current state, as
+        a list of (image, position) pairs in the order they are drawn. """
         # Determine which sprite to use according to our age, the direction we're facing,
         # and our current position along the animation
-        age_images = self.images[int(min(floor(self.age/self.config.ageing_interval), 3))]
+        age_images = self.images[self.get_life_stage()]
         direction_quadrant = int(((self.direction + pi/4)%(2*pi))/(pi/2))
         animation_frame = int(self.iteration_counter/self.config.animation_frame_interval) \
                               % len(age_images[direction_quadrant])
 
         # Offset the sprite such that the sprite's feet (instead of the top-left corner)
         # are on top of our current coordinates
-        screen.blit(age_images[direction_quadrant][animation_frame],
+        sprites = [(age_images[direction_quadrant][animation_frame],
                     (self.x - self.config.critter_horizontal_center,
-                     self.y - self.config.critter_vertical_center))
+                     self.y - self.config.critter_vertical_center))]
 
         # Draw the heart if necessary
         if self.heart_countdown > 0:
-            screen.blit(self.heart_image,
+            sprites.append((self.heart_image,
                     (self.x - self.config.critter_horizontal_center + self.config.heart_offset - 2,
-                     self.y - self.config.critter_vertical_center - self.config.heart_offset - 7))
+                     self.y - self.config.critter_vertical_center - self.config.heart_offset - 7)))
+        return sprites
 
     def is_mature(self):
         """ Determines whether the critter is old enough to reproduce. """
         return self.age >= self.config.maturity_age
 
+    def get_life_stage(self):
+        """ Get the critter's life stage, which goes up every ageing_interval
+        seconds: 0=child, 1=teenager, 2=adult, 3=elder. """
+        return int(min(floor(self.age/self.config.ageing_interval), 3))
+
     def get_type(self):
         return "Critter"
 
+def array_attribute(name):
+    """ Make a property which reads and writes the given field of an
+    ArrayCritter's row of the World's CritterArrays. """
+    def get(self):
+        if self.row == None:
+            return self.released_state[name]
+        return getattr(self.world.critter_state, name).item(self.row)
+
+    def set(self, value):
+        if self.row == None:
+            self.released_state[name] = value
+        else:
+            getattr(self.world.critter_state, name)[self.row] = value
+
+    return property(get, set)
+
+class ArrayCritter(Critter):
+    """ A Critter whose position, direction, energy and counters are kept
+    in a row of the World's CritterArrays (see arrays.py), instead of in
+    its own attributes, so that they can be updated for every critter at
+    once. Used when the critter_array_backend setting is on.
+
+    Reading and writing the attributes works the same as for a Critter,
+    so rendering and the Agent don't need to know the difference. """
+
+    x = array_attribute("x")
+    y = array_attribute("y")
+    direction = array_attribute("direction")
+    energy = array_attribute("energy")
+    age = array_attribute("age")
+    iteration_counter = array_attribute("iteration_counter")
+    heart_countdown = array_attribute("heart_countdown")
+
+    def __init__(self, config, world, object_ID, x, y, direction,
+                 counter_offset, age, images, gender, parent1=None, parent2=None):
+        """ Create a new ArrayCritter; the parameters are the same as for Critter. """
+        # Claim a row before Critter.__init__ sets our attributes
+        self.world = world
+        self.row = world.critter_state.allocate(self)
+        Critter.__init__(self, config, world, object_ID, x, y, direction,
+                         counter_offset, age, images, gender, parent1, parent2)
+
+        # Copy over the things the batched agent needs to know
+        state = world.critter_state
+        state.male[self.row] = (gender == "m")
+        state.traits[self.row] = [self.agent.traits[t] for t in state.trait_names]
+
+    def perceive(self):
+        # Already worked out for all the critters at once by CritterArrays.perceive
+        return self.world.critter_state.visible_objects(self.row)
+
+    def update(self, timer=None):
+        # Nothing to do; the World updates all the ArrayCritters at once with
+        # CritterArrays.perceive, agent.compute_next_actions and CritterArrays.step
+        pass
+
+    def kill(self):
+        # Give up our row, but keep a copy of our final state in case
+        # anything still looks at us
+        state = self.world.critter_state
+        self.released_state = {}
+        for name in CritterArrays.float_fields + CritterArrays.int_fields:
+            self.released_state[name] = getattr(state, name).item(self.row)
+        state.release(self.row)
+        self.row = None
+
 class Scenery(Object):
     """ A scenery object (like a tree or bush), not including tiles.
     Critters move around these. """
@@ -268,7 +372,8 @@ class Scenery(Object):
     def __init__(self, config, world, object_ID, x, y, image,
                     horizontal_offset, vertical_offset):
         """ Create a scenery object.
-        object_ID - not used
+        object_ID - replaced with a stable ID by the World when the scenery
+                    is added to it
         horizontal_offset, vertical_offset
             - offset applied to the image so that a reasonable point on the image
               (such as the trunk of a tree) lines up with (x,y), and not
@@ -287,6 +392,10 @@ class Scenery(Object):
         screen.blit(self.image, (self.x - self.horizontal_offset,
                                  self.y - self.vertical_offset))
 
+    def get_rect(self):
+        return self.image.get_rect(topleft=(self.x - self.horizontal_offset,
+                                            self.y - self.vertical_offset))
+
     def get_type(self):
         return "Scenery"
     
@@ -309,7 +418,11 @@ class Skeleton(Object):
         screen.blit(self.image, (self.x - self.horizontal_offset,
                                  self.y - self.vertical_offset))
 
-    def update(self):
+    def get_rect(self):
+        return self.image.get_rect(topleft=(self.x - self.horizontal_offset,
+                                            self.y - self.vertical_offset))
+
+    def update(self, timer=None):
         self.countdown -= 1
         if self.countdown <= 0:
             self.world.delete_skeleton(self)
@@ -0,0 +1,126 @@
+"""
+perception.py
+
+Contains the batched perception kernel, which finds everything each
+critter can see for many critters at once using NumPy.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+# NumPy is only needed for the array backend, so don't insist on it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def find_neighbours(x, y, target_x, target_y, world_width, world_height,
+                    radius, exclude=None, block_size=4096):
+    """ For each "looker" at (x[i], y[i]), find every target strictly within
+    radius of it in the toroidal world.
+
+    x, y - arrays giving the positions of the lookers
+    target_x, target_y - arrays giving the positions of the targets
+    exclude - optional integer array giving, for each looker, the index of a
+              target to leave out of its results (usually the looker itself),
+              or -1 for none
+    block_size - number of lookers to handle at a time; bounds the size of the
+                 temporary arrays
+
+    The targets are bucketed into a grid of cells at least radius wide, so each
+    looker is only compared against the targets in the 3x3 block of cells around
+    it. Returns a tuple (offsets, indices, dx, dy) in CSR form: the neighbours of
+    looker i are indices[offsets[i]:offsets[i+1]], and dx and dy give their
+    positions relative to the looker, taking the shorter way around the world. """
+    num_lookers = len(x)
+    radius_sq = radius**2
+
+    # Bucket the targets by cell. After sorting, the targets in cell c are
+    # order[cell_start[c]:cell_start[c+1]].
+    cols = max(1, int(world_width // radius))
+    rows = max(1, int(world_height // radius))
+    cell_width = world_width / cols
+    cell_height = world_height / rows
+
+    target_cells = cell_indices(target_x, target_y, cols, rows, cell_width, cell_height)
+    order = numpy.argsort(target_cells, kind="mergesort")
+    cell_start = numpy.zeros(cols*rows + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(target_cells, minlength=cols*rows), out=cell_start[1:])
+
+    # Offsets to the neighbouring cells; small worlds have fewer than 3 rows
+    # or columns, and we don't want to visit the same cell twice
+    col_offsets = [-1, 0, 1] if cols >= 3 else range(cols)
+    row_offsets = [-1, 0, 1] if rows >= 3 else range(rows)
+
+    found_lookers = []
+    found_targets = []
+    found_dx = []
+    found_dy = []
+
+    for block_start in xrange(0, num_lookers, block_size):
+        block = slice(block_start, min(block_start + block_size, num_lookers))
+        block_x = x[block]
+        block_y = y[block]
+        block_lookers = numpy.arange(block.start, block.stop)
+        looker_col = (block_x // cell_width).astype(numpy.int64) % cols
+        looker_row = (block_y // cell_height).astype(numpy.int64) % rows
+
+        for row_offset in row_offsets:
+            for col_offset in col_offsets:
+                cells = ((looker_row + row_offset) % rows)*cols + (looker_col + col_offset) % cols
+
+                # Expand into one (looker, target) pair per target in the cell
+                starts = cell_start[cells]
+                counts = cell_start[cells + 1] - starts
+                total = counts.sum()
+                if total == 0:
+                    continue
+                pair_lookers = numpy.repeat(numpy.arange(len(cells)), counts)
+                pair_positions = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts) \
+                                 + starts[pair_lookers]
+                pair_targets = order[pair_positions]
+
+                dx = wrap(target_x[pair_targets] - block_x[pair_lookers], world_width)
+                dy = wrap(target_y[pair_targets] - block_y[pair_lookers], world_height)
+
+                keep = dx*dx + dy*dy < radius_sq
+                if exclude is not None:
+                    keep &= pair_targets != exclude[block][pair_lookers]
+
+                found_lookers.append(block_lookers[pair_lookers[keep]])
+                found_targets.append(pair_targets[keep])
+                found_dx.append(dx[keep])
+                found_dy.append(dy[keep])
+
+    if found_lookers == []:
+        empty = numpy.zeros(0)
+        return (numpy.zeros(num_lookers + 1, dtype=numpy.int64),
+                numpy.zeros(0, dtype=numpy.int64), empty, empty)
+
+    # Group the pairs by looker (keeping the order within each group stable)
+    lookers = numpy.concatenate(found_lookers)
+    by_looker = numpy.argsort(lookers, kind="mergesort")
+    offsets = numpy.zeros(num_lookers + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(lookers, minlength=num_lookers), out=offsets[1:])
+
+    return (offsets,
+            numpy.concatenate(found_targets)[by_looker],
+            numpy.concatenate(found_dx)[by_looker],
+            numpy.concatenate(found_dy)[by_looker])
+
+def cell_indices(x, y, cols, rows, cell_width, cell_height):
+    """ Find the index (row*cols + col) of the grid cell containing each point. """
+    col = (x // cell_width).astype(numpy.int64) % cols
+    row = (y // cell_height).astype(numpy.int64) % rows
+    return row*cols + col
+
+def wrap(delta, size):
+    """ Given differences between coordinates in a world which wraps around
+    every size units, take the shorter way around for each one. """
+    delta = numpy.where(delta > size/2, delta - size, delta)
+    return numpy.where(delta < -size/2, delta + size, delta)
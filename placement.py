@@ -0,0 +1,83 @@
+"""
+placement.py
+
+Finds positions for new objects so that they don't start on top of
+scenery or each other.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+from math import *
+
+from spatial import *
+
+class Placer(object):
+    """ Places new objects onto the world, keeping them out of the
+    collision avoidance radius of existing objects. Objects which start
+    too close to scenery mess with the collision avoidance.
+
+    Rather than retrying forever, each object gets a bounded number of
+    randomly sampled positions; if none of them are free (because the
+    world is full), the object is left at the last position tried. """
+
+    def __init__(self, config, random_stream, max_attempts=10):
+        """ Create a Placer.
+        random_stream - random.Random to draw the positions tried from
+        max_attempts - number of positions to try for each object before
+                       giving up and leaving it where it is """
+        self.config = config
+        self.random = random_stream
+        self.max_attempts = max_attempts
+
+        # New objects must be at least this (squared) distance from
+        # every existing object
+        self.clearance_sq = 1.5*config.scenery_avoidance_radius_sq
+
+    def place(self, obj, occupied, max_attempts=None):
+        """ Move obj to a position which is clear of all the objects in occupied
+        (a SpatialHash). Its current position is tried first. Returns True
+        if a clear position was found, False if the object had to be left
+        too close to something. obj is not added to occupied.
+        max_attempts - overrides self.max_attempts if given """
+        if max_attempts == None:
+            max_attempts = self.max_attempts
+        for attempt in xrange(max_attempts):
+            if not occupied.any_within(obj.x, obj.y, self.clearance_sq, obj):
+                return True
+            obj.x = self.random.random()*self.config.world_width
+            obj.y = self.random.random()*self.config.world_height
+        return False
+
+    def place_many(self, new_objs, existing_objs):
+        """ Place a batch of new objects, keeping them clear of each other as well
+        as of existing_objs. Builds a temporary occupancy grid with cells the
+        size of the clearance radius, so each check only looks at a few cells.
+        Returns the number of objects which could not be given a clear position. """
+        occupied = SpatialHash(self.config.world_width, self.config.world_height,
+                               sqrt(self.clearance_sq))
+        for obj in existing_objs:
+            occupied.insert(obj)
+
+        # Once the world has filled up, nearly every attempt fails; so after
+        # a run of failures, only try once per object until one succeeds.
+        failures = 0
+        failures_in_a_row = 0
+        for obj in new_objs:
+            if failures_in_a_row >= self.max_attempts:
+                placed = self.place(obj, occupied, 1)
+            else:
+                placed = self.place(obj, occupied)
+
+            if placed:
+                failures_in_a_row = 0
+            else:
+                failures += 1
+                failures_in_a_row += 1
+            occupied.insert(obj)
+        return failures
@@ -0,0 +1,208 @@
+"""
+population.py
+
+Contains PopulationStatistics, which keeps summary statistics of the
+critters in a World up to date as they are born, grow up and die, so that
+the graphs (and anything else) can read them without looking at every
+critter.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+import heapq
+from math import sqrt
+
+class PopulationStatistics(object):
+    """ Statistics of the critters currently in a World: how many there are
+    of each gender and in each life stage, and for each agent trait, the
+    sum and sum of squares (giving the mean and variance), the minimum and
+    maximum, and a histogram of the values.
+
+    The World calls add when a critter is added and remove when one is
+    removed, and critters call update_life_stage when they get older, so
+    each change costs constant time (or logarithmic in the number of
+    critters, for the minimum and maximum), and so does reading any of
+    the statistics.
+
+    The histograms have histogram_bins equal-width bins between the
+    <trait>_min and <trait>_max settings of each trait. Inherited values
+    can't go outside those, but the initial value of a trait can; values
+    outside the range are counted in the first or last bin. """
+
+    # Names of the life stages, which are counted by get_life_stage's
+    # return value (the same stages the critters' sprites show)
+    life_stage_names = ["child", "teenager", "adult", "elder"]
+
+    def __init__(self, config, trait_names, histogram_bins):
+        self.trait_names = trait_names
+        self.histogram_bins = histogram_bins
+        self.count = 0
+        self.gender_counts = {"m": 0, "f": 0}
+        self.life_stage_counts = [0]*len(PopulationStatistics.life_stage_names)
+
+        # Map from trait name to (lower bound, width of each bin) of its histogram
+        self.histogram_ranges = {}
+        for trait in trait_names:
+            (low, high) = config.trait_bounds[trait]
+            self.histogram_ranges[trait] = (low, (high - low)/histogram_bins)
+
+        # Maps from trait name to the statistic for that trait
+        self.sums = dict((trait, 0.0) for trait in trait_names)
+        self.sums_of_squares = dict((trait, 0.0) for trait in trait_names)
+        self.histograms = dict((trait, [0]*histogram_bins) for trait in trait_names)
+
+        # The minimum and maximum come from a heap of every value (negated,
+        # for the maximum). Values removed since are only taken off the heap
+        # when they reach the top; until then they're counted in the
+        # corresponding map from value to number of copies removed.
+        self.min_heaps = dict((trait, []) for trait in trait_names)
+        self.max_heaps = dict((trait, []) for trait in trait_names)
+        self.removed_mins = dict((trait, {}) for trait in trait_names)
+        self.removed_maxes = dict((trait, {}) for trait in trait_names)
+
+        # Map from object_ID to (gender, life stage, tuple of trait values)
+        # of each critter, as they were counted
+        self.critters = {}
+
+    def add(self, critter):
+        """ Count a critter which has been added to the World. """
+        values = tuple(critter.agent.traits[trait] for trait in self.trait_names)
+        life_stage = critter.get_life_stage()
+        self.critters[critter.object_ID] = (critter.gender, life_stage, values)
+
+        self.count += 1
+        self.gender_counts[critter.gender] += 1
+        self.life_stage_counts[life_stage] += 1
+        for (trait, value) in zip(self.trait_names, values):
+            self.sums[trait] += value
+            self.sums_of_squares[trait] += value*value
+            self.histograms[trait][self.histogram_bin(trait, value)] += 1
+            heapq.heappush(self.min_heaps[trait], value)
+            heapq.heappush(self.max_heaps[trait], -value)
+
+    def remove(self, critter):
+        """ Stop counting a critter which has been removed from the World. """
+        (gender, life_stage, values) = self.critters.pop(critter.object_ID)
+
+        self.count -= 1
+        self.gender_counts[gender] -= 1
+        self.life_stage_counts[life_stage] -= 1
+        for (trait, value) in zip(self.trait_names, values):
+            self.sums[trait] -= value
+            self.sums_of_squares[trait] -= value*value
+            self.histograms[trait][self.histogram_bin(trait, value)] -= 1
+            removed_mins = self.removed_mins[trait]
+            removed_mins[value] = removed_mins.get(value, 0) + 1
+            removed_maxes = self.removed_maxes[trait]
+            removed_maxes[-value] = removed_maxes.get(-value, 0) + 1
+
+        if self.count == 0:
+            # Start again from nothing, rather than keep any rounding errors
+            # in the sums
+            for trait in self.trait_names:
+                self.sums[trait] = 0.0
+                self.sums_of_squares[trait] = 0.0
+                del self.min_heaps[trait][:]
+                del self.max_heaps[trait][:]
+                self.removed_mins[trait].clear()
+                self.removed_maxes[trait].clear()
+        else:
+            # Each heap only loses its removed values when they reach the
+            # top (which depends on which statistics have been read), so
+            # rebuild any heap that's mostly removed values, so it doesn't
+            # keep growing for the whole run
+            for (trait_index, trait) in enumerate(self.trait_names):
+                if len(self.min_heaps[trait]) > 2*self.count + 64:
+                    self.min_heaps[trait] = self.trait_values(trait_index, 1)
+                    self.removed_mins[trait].clear()
+                if len(self.max_heaps[trait]) > 2*self.count + 64:
+                    self.max_heaps[trait] = self.trait_values(trait_index, -1)
+                    self.removed_maxes[trait].clear()
+
+    def trait_values(self, trait_index, sign):
+        """ Make a heap of the values of a trait (given by its index in
+        trait_names) of every critter counted, multiplied by sign. """
+        heap = [sign*values[trait_index]
+                for (gender, life_stage, values) in self.critters.itervalues()]
+        heapq.heapify(heap)
+        return heap
+
+    def update_life_stage(self, critter):
+        """ Move a critter to the life stage for its current age, if it's
+        changed. Called when a critter's age changes; does nothing if the
+        critter isn't counted (e.g. it has died). """
+        if critter.object_ID not in self.critters:
+            return
+        (gender, life_stage, values) = self.critters[critter.object_ID]
+        new_life_stage = critter.get_life_stage()
+        if new_life_stage != life_stage:
+            self.life_stage_counts[life_stage] -= 1
+            self.life_stage_counts[new_life_stage] += 1
+            self.critters[critter.object_ID] = (gender, new_life_stage, values)
+
+    def histogram_bin(self, trait, value):
+        """ Get the index of the histogram bin a value of a trait is counted in. """
+        (low, bin_width) = self.histogram_ranges[trait]
+        if bin_width <= 0:
+            return 0
+        return max(0, min(int((value - low)/bin_width), self.histogram_bins - 1))
+
+    def mean(self, trait):
+        """ Get the mean value of a trait, or 0 if there are no critters. """
+        if self.count == 0:
+            return 0
+        return self.sums[trait]/self.count
+
+    def variance(self, trait):
+        """ Get the (population) variance of a trait, or 0 if there are no critters. """
+        if self.count == 0:
+            return 0
+        mean = self.sums[trait]/self.count
+        return max(0.0, self.sums_of_squares[trait]/self.count - mean*mean)
+
+    def standard_deviation(self, trait):
+        """ Get the (population) standard deviation of a trait. """
+        return sqrt(self.variance(trait))
+
+    def minimum(self, trait):
+        """ Get the lowest value of a trait, or None if there are no critters. """
+        heap = self.min_heaps[trait]
+        discard_removed(heap, self.removed_mins[trait])
+        if heap == []:
+            return None
+        return heap[0]
+
+    def maximum(self, trait):
+        """ Get the highest value of a trait, or None if there are no critters. """
+        heap = self.max_heaps[trait]
+        discard_removed(heap, self.removed_maxes[trait])
+        if heap == []:
+            return None
+        return -heap[0]
+
+    def histogram(self, trait):
+        """ Get the histogram of a trait, as a list of the number of critters
+        in each bin, from the lowest values to the highest. """
+        return list(self.histograms[trait])
+
+    def histogram_edges(self, trait):
+        """ Get the boundaries of the bins of a trait's histogram, as a list
+        of histogram_bins + 1 values. """
+        (low, bin_width) = self.histogram_ranges[trait]
+        return [low + i*bin_width for i in xrange(self.histogram_bins + 1)]
+
+def discard_removed(heap, removed):
+    """ Pop values off the top of a heap for as long as they're counted in
+    removed (a map from value to number of copies to remove). """
+    while heap != [] and heap[0] in removed:
+        value = heapq.heappop(heap)
+        if removed[value] == 1:
+            del removed[value]
+        else:
+            removed[value] -= 1
@@ -0,0 +1,197 @@
+"""
+profiling.py
+
+Contains the FrameTimer, which measures how long each phase of a frame
+(perception, movement, drawing and so on) takes, for the frame_timing
+setting.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+import sys
+from math import ceil
+from collections import deque
+
+def monotonic_clock():
+    """ Get a function returning the time in seconds from a clock which
+    never goes backwards (unlike the wall clock, which can be set), or None
+    if there's no way to read one. """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+    except ImportError:
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    # Older C libraries keep clock_gettime in librt
+    for library in ("c", "rt"):
+        name = ctypes.util.find_library(library)
+        if name == None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(name).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        clock_gettime.restype = ctypes.c_int
+
+        CLOCK_MONOTONIC = 1
+        now = timespec()
+        now_pointer = ctypes.pointer(now)
+        def monotonic():
+            clock_gettime(CLOCK_MONOTONIC, now_pointer)
+            return now.tv_sec + now.tv_nsec*1e-9
+
+        if clock_gettime(CLOCK_MONOTONIC, now_pointer) == 0:
+            return monotonic
+    return None
+
+# The highest-resolution monotonic clock there is; perf_counter only exists
+# in Python 3. As a last resort the wall clock is used, and lap ignores it
+# going backwards.
+try:
+    from time import perf_counter as timer
+except ImportError:
+    timer = monotonic_clock()
+    if timer == None:
+        from timeit import default_timer as timer
+
+class FrameTimer(object):
+    """ Times the phases of each frame, and keeps the times of the last
+    window frames, so that their percentiles can be shown (see summary).
+
+    The code being timed calls lap(phase) at the end of each phase, which
+    adds the time since the previous call to that phase's total for the
+    frame; a phase can be timed in several pieces. end_frame finishes the
+    frame. So the phases between them account for all of the frame's time.
+
+    Every window frames, the percentiles are written to out_file (as CSV,
+    like the graphs' exports) and to a TelemetrySink, if given. """
+
+    # The phases in the order they happen in, which is the order summary
+    # lists them in
+    phase_names = [
+        # World.step
+        "perception",       # finding what each critter can see
+        "decisions",        # the agents deciding what to do
+        "movement",
+        "interaction",      # eating and reproducing
+        "decay",            # energy decay, ageing and death
+        "skeletons",
+        "food_spawning",
+        "graph_updates",
+        "recording",
+
+        # World.render
+        "birds",
+        "sorting",          # putting the objects in drawing order
+        "tile_blits",       # drawing the background (and with it, the scenery)
+        "object_blits",
+        "graph_drawing",
+        "hud",
+
+        # World.run
+        "display_flip",
+        "waiting"           # waiting for the next frame, and handling events
+    ]
+
+    # Percentiles given by summary
+    percentiles = [50, 90, 99]
+
+    def __init__(self, window, out_file=None, telemetry=None):
+        """ Create a new FrameTimer.
+        window - number of frames the percentiles are taken over
+        out_file - filename of file to export to; if empty string or None,
+                   do not export to file
+        telemetry - TelemetrySink to record the percentiles to, or None """
+        self.window = window
+        self.telemetry = telemetry
+        self.frames = 0
+
+        # Map from phase to its total so far in the current frame, and to
+        # the times it took in the last window frames (in seconds); and the
+        # total times of the last window frames
+        self.current = {}
+        self.history = {}
+        self.frame_times = deque(maxlen=window)
+
+        self.last_lap = timer()
+
+        if out_file != None and out_file != "":
+            self.out = open(out_file, "w")
+            self.out.write("Frame timing (milliseconds)\n")
+            self.out.write("Frame,Phase,Mean,{0}\n".format(
+                ",".join("P{0}".format(percentile) for percentile in FrameTimer.percentiles)))
+        else:
+            self.out = None
+
+    def lap(self, phase):
+        """ End a (piece of a) phase; the time since the last lap is added
+        to the phase's time for this frame. """
+        now = timer()
+        self.current[phase] = self.current.get(phase, 0.0) + max(0.0, now - self.last_lap)
+        self.last_lap = now
+
+    def end_frame(self, frame):
+        """ Finish timing a frame, given the World's frame counter. """
+        for phase in self.current:
+            if phase not in self.history:
+                self.history[phase] = deque(maxlen=self.window)
+        for (phase, times) in self.history.items():
+            times.append(self.current.get(phase, 0.0))
+        self.frame_times.append(sum(self.current.values()))
+        self.current = {}
+
+        self.frames += 1
+        if self.frames % self.window == 0:
+            self.export(frame)
+
+    def summary(self):
+        """ Get the times of the phases over the last window frames, in
+        milliseconds, as a list of tuples (phase, mean, percentiles...). The
+        phases are in phase_names order, followed by the whole "frame";
+        phases which haven't happened yet are left out. """
+        rows = []
+        for phase in FrameTimer.phase_names + ["frame"]:
+            if phase == "frame":
+                times = sorted(self.frame_times)
+            elif phase in self.history:
+                times = sorted(self.history[phase])
+            else:
+                continue
+            if times == []:
+                continue
+            row = [phase, 1000*sum(times)/len(times)]
+            for percentile in FrameTimer.percentiles:
+                # Nearest-rank percentile
+                rank = max(1, int(ceil(percentile/100*len(times))))
+                row.append(1000*times[rank - 1])
+            rows.append(tuple(row))
+        return rows
+
+    def export(self, frame):
+        """ Write the summary to the output file and telemetry. """
+        for row in self.summary():
+            if self.out != None:
+                self.out.write("{0},{1},{2}\n".format(
+                    frame, row[0], ",".join("{0:.4f}".format(value) for value in row[1:])))
+            if self.telemetry != None:
+                self.telemetry.record("time_{0}_mean".format(row[0]), frame, row[1])
+                for (percentile, value) in zip(FrameTimer.percentiles, row[2:]):
+                    self.telemetry.record("time_{0}_p{1}".format(row[0], percentile),
+                                          frame, value)
+
+    def finish(self):
+        """ Called when the simulation ends, so that the output file can be closed. """
+        if self.out != None:
+            self.out.close()
@@ -0,0 +1,314 @@
+"""
+recording.py
+
+Contains the Recorder, which records a run of the simulation to a file,
+and Replay, which plays a recording back (see replay.py) without running
+the simulation again.
+
+A recording is a series of chunks. Each chunk starts with a keyframe, a
+checkpoint of the whole World (see checkpoint.py), followed by a delta for
+each later frame up to the next keyframe, which says what changed: which
+objects were added and removed, where the critters moved to, and any of
+their counters which didn't just tick over as usual. The values in each
+delta are packed into columns, and each chunk is compressed separately, so
+any frame can be reached by reading one chunk and applying at most
+keyframe_interval deltas.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import os
+import sys
+import zlib
+import array
+import struct
+import bisect
+import cPickle as pickle
+
+#imports from our own files
+from checkpoint import *
+
+# Written at the start of every recording; change the number when the
+# format changes
+recording_magic = "Critters recording 1\n"
+
+# Each chunk is preceded by its size in bytes (once compressed), the number
+# of its first frame and its number of frames
+chunk_header = struct.Struct("<QQQ")
+
+# Values recorded for critters which moved, and for critters whose age or
+# counters need correcting (see Recorder.record_frame)
+moved_fields = [("object_ID", "i"), ("x", "f"), ("y", "f"), ("direction", "f")]
+counter_fields = [("object_ID", "i"), ("age", "i"), ("iteration_counter", "i"),
+                  ("heart_countdown", "i")]
+
+class Recorder(object):
+    """ Records every frame of a World's run to a file. Set it as the World's
+    recorder, and the World calls record_frame after each frame and finish
+    when it finishes. """
+
+    def __init__(self, world, filename, keyframe_interval):
+        """ Start recording a World, from the frame it has reached so far.
+        keyframe_interval - number of frames between keyframes; recordings
+                            with more keyframes are bigger, but quicker to seek """
+        self.world = world
+        self.keyframe_interval = keyframe_interval
+        self.out = open(filename, "wb")
+        self.out.write(recording_magic)
+        self.start_chunk()
+
+    def start_chunk(self):
+        """ Start a new chunk with a keyframe of the World as it is now. """
+        self.chunk = {"byteorder": sys.byteorder,
+                      "keyframe": take_checkpoint(self.world).state,
+                      "deltas": []}
+        self.chunk_start = self.world.counter
+
+        # What the world looked like as of the last frame recorded; each
+        # delta records the differences from this
+        self.object_IDs = set(obj.object_ID for obj in self.world.objects)
+        self.skeleton_IDs = set(skeleton.object_ID for skeleton in self.world.skeletons)
+        self.positions = {}
+        self.counters = {}
+        for obj in self.world.objects:
+            if obj.get_type() == "Critter":
+                self.positions[obj.object_ID] = (obj.x, obj.y, obj.direction)
+                self.counters[obj.object_ID] = (obj.age, obj.iteration_counter,
+                                                obj.heart_countdown)
+
+    def record_frame(self):
+        """ Record the frame the World has just finished. """
+        if self.world.counter - self.chunk_start >= self.keyframe_interval:
+            self.write_chunk()
+            self.start_chunk()
+            return
+
+        world = self.world
+        framerate = world.config.framerate
+        objects = list(world.objects)
+        skeletons = list(world.skeletons)
+        object_IDs = set(obj.object_ID for obj in objects)
+        skeleton_IDs = set(skeleton.object_ID for skeleton in skeletons)
+
+        born = []
+        moved = []
+        corrected = []
+        positions = {}
+        counters = {}
+        for obj in objects:
+            if obj.get_type() != "Critter":
+                continue
+            position = (obj.x, obj.y, obj.direction)
+            counter = (obj.age, obj.iteration_counter, obj.heart_countdown)
+            positions[obj.object_ID] = position
+            counters[obj.object_ID] = counter
+
+            if obj.object_ID not in self.positions:
+                born.append(obj)
+                continue
+            if position != self.positions[obj.object_ID]:
+                moved.append(obj)
+
+            # Every frame, the iteration counter goes up by one, and each
+            # second the age goes up and the heart countdown goes down; only
+            # record a critter's counters if anything else happened to them
+            (age, iteration_counter, heart_countdown) = self.counters[obj.object_ID]
+            iteration_counter += 1
+            if iteration_counter % framerate == 0:
+                age += 1
+                heart_countdown -= 1
+            if counter != (age, iteration_counter, heart_countdown):
+                corrected.append(obj)
+
+        added = object_IDs - self.object_IDs
+        self.chunk["deltas"].append({
+            "removed": pack_IDs(self.object_IDs - object_IDs),
+            "removed_skeletons": pack_IDs(self.skeleton_IDs - skeleton_IDs),
+            "moved": pack_objects(moved, moved_fields),
+            "corrected": pack_objects(corrected, counter_fields),
+            "born": pack_critters(born),
+            "born_traits": pack_traits(born),
+            "born_genders": "".join(critter.gender for critter in born),
+            "food": pack_objects([obj for obj in objects if obj.object_ID in added
+                                      and obj.get_type() == "Food"], food_fields),
+            "skeletons": pack_objects([skeleton for skeleton in skeletons
+                                           if skeleton.object_ID not in self.skeleton_IDs],
+                                      skeleton_fields)
+        })
+
+        self.object_IDs = object_IDs
+        self.skeleton_IDs = skeleton_IDs
+        self.positions = positions
+        self.counters = counters
+
+    def write_chunk(self):
+        """ Compress the current chunk and write it to the file. """
+        data = zlib.compress(pickle.dumps(self.chunk, pickle.HIGHEST_PROTOCOL), 6)
+        self.out.write(chunk_header.pack(len(data), self.chunk_start,
+                                         1 + len(self.chunk["deltas"])))
+        self.out.write(data)
+        self.out.flush()
+
+    def finish(self):
+        """ Write the last chunk and close the file. """
+        if self.out.closed:
+            return
+        self.write_chunk()
+        self.out.close()
+
+class Replay(object):
+    """ Plays back a recording made by a Recorder, by rebuilding the World
+    frame by frame from the recording instead of running the simulation.
+
+    The World is a real World, so it is drawn by its own render method, but
+    its step method is never called: nothing in it happens by itself. The
+    recorded values are simply copied into it, and the graphs updated.
+    (The eagle and dove aren't recorded, since they don't affect anything;
+    they fly around as usual when the World is rendered.) """
+
+    def __init__(self, filename, screen, config):
+        """ Open a recording, to play it back into a World drawn to screen.
+        config should be the configuration the recording was made with
+        (although settings which only affect drawing can differ). """
+        self.screen = screen
+        self.config = config
+        self.file = open(filename, "rb")
+        if self.file.read(len(recording_magic)) != recording_magic:
+            raise ValueError("Not a recording, or from a different version")
+
+        # Find the chunks; only their headers need to be read. A chunk cut
+        # short (because the recording was never finished) is left out.
+        file_size = os.fstat(self.file.fileno()).st_size
+        self.chunk_offsets = []
+        self.chunk_starts = []
+        self.chunk_lengths = []
+        while True:
+            header = self.file.read(chunk_header.size)
+            if len(header) < chunk_header.size:
+                break
+            (size, start, length) = chunk_header.unpack(header)
+            offset = self.file.tell()
+            if offset + size > file_size:
+                break
+            self.file.seek(offset + size)
+            self.chunk_offsets.append((offset, size))
+            self.chunk_starts.append(start)
+            self.chunk_lengths.append(length)
+        if self.chunk_starts == []:
+            raise ValueError("The recording is empty")
+
+        self.first_frame = self.chunk_starts[0]
+        self.last_frame = self.chunk_starts[-1] + self.chunk_lengths[-1] - 1
+
+        # The chunk loaded most recently, and which one it is
+        self.chunk = None
+        self.chunk_index = None
+
+        # The World being played back into, and the frame it is showing
+        self.world = None
+        self.frame = None
+
+    def seek(self, frame):
+        """ Make the World show the given frame (clamped to the frames in the
+        recording). Going forwards a little way just applies the deltas in
+        between; otherwise the World is rebuilt from the nearest keyframe. """
+        frame = max(self.first_frame, min(frame, self.last_frame))
+        chunk_index = bisect.bisect_right(self.chunk_starts, frame) - 1
+        chunk_start = self.chunk_starts[chunk_index]
+
+        if self.world == None or chunk_index != self.chunk_index or frame < self.frame:
+            self.load_chunk(chunk_index)
+            self.world = Checkpoint(self.chunk["keyframe"]).restore(self.screen, self.config)
+            self.world.prepare_rendering()
+            self.frame = chunk_start
+
+        while self.frame < frame:
+            self.frame += 1
+            self.apply_delta(self.chunk["deltas"][self.frame - chunk_start - 1])
+
+    def load_chunk(self, chunk_index):
+        """ Read and decompress a chunk, unless it's already loaded. """
+        if chunk_index == self.chunk_index:
+            return
+        (offset, size) = self.chunk_offsets[chunk_index]
+        self.file.seek(offset)
+        self.chunk = pickle.loads(zlib.decompress(self.file.read(size)))
+        self.chunk_index = chunk_index
+
+    def apply_delta(self, delta):
+        """ Change the World from the last frame to the next. """
+        world = self.world
+        config = self.config
+        byteorder = self.chunk["byteorder"]
+
+        for object_ID in unpack_IDs(delta["removed"], byteorder):
+            world.delete(world.objects.get(object_ID))
+        for object_ID in unpack_IDs(delta["removed_skeletons"], byteorder):
+            world.delete_skeleton(world.skeletons.get(object_ID))
+
+        # Tick over the critters' counters, as Critter.decay does
+        for obj in world.objects:
+            if obj.get_type() == "Critter":
+                obj.iteration_counter += 1
+                if obj.iteration_counter % config.framerate == 0:
+                    obj.age += 1
+                    obj.heart_countdown -= 1
+                    world.population_stats.update_life_stage(obj)
+
+        moved = unpack_columns(delta["moved"], moved_fields, byteorder)
+        for (object_ID, x, y, direction) in zip(moved["object_ID"], moved["x"],
+                                                moved["y"], moved["direction"]):
+            critter = world.objects.get(object_ID)
+            critter.x = x
+            critter.y = y
+            critter.direction = direction
+            world.spatial_hash.move(critter)
+
+        corrected = unpack_columns(delta["corrected"], counter_fields, byteorder)
+        for row in xrange(len(corrected["object_ID"])):
+            critter = world.objects.get(corrected["object_ID"][row])
+            critter.age = corrected["age"][row]
+            critter.iteration_counter = corrected["iteration_counter"][row]
+            critter.heart_countdown = corrected["heart_countdown"][row]
+            world.population_stats.update_life_stage(critter)
+
+        born = unpack_columns(delta["born"], critter_fields, byteorder)
+        traits = unpack_traits(delta["born_traits"], byteorder)
+        for (row, gender) in enumerate(delta["born_genders"]):
+            world.add_here(make_critter(world, gender,
+                               dict((name, column[row]) for (name, column) in born.items()),
+                               dict((name, column[row]) for (name, column) in traits.items())),
+                           keep_ID=True)
+
+        food = unpack_columns(delta["food"], food_fields, byteorder)
+        for row in xrange(len(food["object_ID"])):
+            world.add_here(Food(config, world, food["object_ID"][row], food["x"][row],
+                                food["y"][row], food["energy"][row]), keep_ID=True)
+
+        skeletons = unpack_columns(delta["skeletons"], skeleton_fields, byteorder)
+        for row in xrange(len(skeletons["object_ID"])):
+            skeleton = Skeleton(config, world, skeletons["object_ID"][row],
+                                skeletons["x"][row], skeletons["y"][row], get_skeleton(),
+                                config.skeleton_horizontal_offset,
+                                config.skeleton_vertical_offset)
+            skeleton.countdown = skeletons["countdown"][row]
+            world.add_skeleton(skeleton, keep_ID=True)
+
+        world.counter = self.frame
+        for graph in world.graphs:
+            graph.update()
+
+    def close(self):
+        self.file.close()
+
+def pack_IDs(object_IDs):
+    """ Pack a collection of object IDs into a string of bytes. """
+    return array.array("i", sorted(object_IDs)).tostring()
+
+def unpack_IDs(packed, byteorder):
+    """ Unpack the IDs from pack_IDs, packed on a machine with the given byte order. """
+    return unpack_columns({"object_ID": packed}, [("object_ID", "i")], byteorder)["object_ID"]
@@ -0,0 +1,171 @@
+"""
+rendering.py
+
+Contains the DirtyRectRenderer, which redraws only the parts of the
+world which have changed since the last frame.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import pygame
+from pygame.locals import *
+
+from depth import *
+
+class DirtyRectRenderer(object):
+    """ Draws a World incrementally, for the dirty_rect_rendering setting.
+
+    Only critters (and the eagle and dove) move; food, scenery and skeletons
+    stay where they are until they are removed. Each frame, the areas covered
+    by the moving sprites in the last frame and in this frame, and by any
+    objects added or removed since the last frame, are "dirty": the background
+    is restored under them, and only the objects overlapping them are drawn
+    again. Since a redrawn object can cover part of another object, anything
+    overlapping a redrawn object is redrawn too.
+
+    The World tells the renderer about every object added and removed, by
+    calling object_added and object_removed.
+
+    Only the World's view_rect is drawn; anything outside it is ignored. """
+
+    def __init__(self, world, screen):
+        """ Create a renderer for the given World, drawing to screen.
+        The objects already in the World are added to it. """
+        self.world = world
+        self.screen = screen
+        self.world_rect = world.view_rect
+
+        # Map from each static object (food, scenery or skeleton) to the
+        # Rect it covers, and the same as a pair of lists, built when needed
+        self.static_rects = {}
+        self.static_lists = None
+
+        # The moving objects (critters), and the Rects they covered when
+        # they were last drawn
+        self.moving = set()
+        self.moving_rects = {}
+
+        # Rects of the static objects added or removed since the last frame
+        self.changed_rects = []
+
+        # Rects covered by the eagle and dove in the last frame
+        self.bird_rects = []
+
+        # Whether the whole world needs redrawing (e.g. on the first frame, or
+        # when the background has changed)
+        self.full_redraw = True
+
+        for obj in world.objects:
+            self.object_added(obj)
+        for obj in world.scenery:
+            self.object_added(obj)
+        for skeleton in world.skeletons:
+            self.object_added(skeleton)
+
+    def object_added(self, obj):
+        """ Called when an object (including a skeleton) is added to the World. """
+        if obj.get_type() == "Critter":
+            self.moving.add(obj)
+        else:
+            rect = obj.get_rect()
+            self.static_rects[obj] = rect
+            self.static_lists = None
+            self.changed_rects.append(rect)
+
+    def object_removed(self, obj):
+        """ Called when an object (including a skeleton) is removed from the
+        World. A removed critter is erased using the Rect it was last drawn at. """
+        if obj.get_type() == "Critter":
+            self.moving.discard(obj)
+        else:
+            rect = self.static_rects.pop(obj, None)
+            if rect != None:
+                self.static_lists = None
+                self.changed_rects.append(rect)
+
+    def render(self, bird_sprites, timer=None):
+        """ Draw everything which has changed since the last call to the screen.
+        bird_sprites - list of (image, position) pairs for the eagle and dove,
+                       which are drawn on top of everything else
+        timer - FrameTimer to time the phases of drawing with, or None
+        Returns a list of the Rects of the screen which have changed. """
+        screen = self.screen
+        background = self.world.background
+
+        moving_rects = dict((obj, obj.get_rect()) for obj in self.moving)
+        bird_rects = [image.get_rect(topleft=position) for (image, position) in bird_sprites]
+
+        if self.full_redraw:
+            dirty = [self.world_rect]
+            redraw = self.static_rects.keys()
+            screen.blit(background, (0, 0))
+        else:
+            dirty = self.changed_rects + self.moving_rects.values() \
+                    + moving_rects.values() + self.bird_rects + bird_rects
+            dirty = [rect for rect in dirty if rect.colliderect(self.world_rect)]
+            redraw = self.find_overlapping(dirty)
+            dirty = [rect.clip(self.world_rect) for rect in dirty]
+            for rect in dirty:
+                screen.blit(background, rect, rect)
+        if timer != None:
+            timer.lap("tile_blits")
+
+        # Sprites near the right edge would otherwise spill into the graph sidebar
+        screen.set_clip(self.world_rect)
+
+        # Draw the skeletons first so they appear underneath all the other
+        # objects, and the rest in order of y-coordinates, as in World.render.
+        # Objects level with each other are drawn in order of ID, so that
+        # they overlap the same way whichever of them are being redrawn.
+        skeletons = self.world.skeletons
+        for obj in redraw:
+            if obj in skeletons:
+                obj.render(screen)
+
+        if timer != None:
+            timer.lap("object_blits")
+        objs = [obj for obj in redraw if obj not in skeletons]
+        objs.extend(obj for (obj, rect) in moving_rects.iteritems()
+                        if rect.colliderect(self.world_rect))
+        objs.sort(key=DepthOrder.sort_key)
+        if timer != None:
+            timer.lap("sorting")
+        for obj in objs:
+            obj.render(screen)
+
+        for (image, position) in bird_sprites:
+            screen.blit(image, position)
+
+        screen.set_clip(None)
+        if timer != None:
+            timer.lap("object_blits")
+
+        self.moving_rects = moving_rects
+        self.bird_rects = bird_rects
+        self.changed_rects = []
+        self.full_redraw = False
+        return dirty
+
+    def find_overlapping(self, dirty):
+        """ Find the static objects which overlap any of the Rects in dirty,
+        or any other object found. The Rects of the objects found are added to
+        dirty, and the objects are returned as a set. """
+        if self.static_lists == None:
+            statics = self.static_rects.keys()
+            self.static_lists = (statics, [self.static_rects[obj] for obj in statics])
+        (statics, rects) = self.static_lists
+
+        redraw = set()
+        index = 0
+        while index < len(dirty):
+            for hit in dirty[index].collidelistall(rects):
+                obj = statics[hit]
+                if obj not in redraw:
+                    redraw.add(obj)
+                    dirty.append(rects[hit])
+            index += 1
+        return redraw
@@ -0,0 +1,120 @@
+"""
+replay.py
+
+Plays back a recording of a run (made by setting record_path in the
+config file) in a window, without running the simulation again.
+
+Usage: python replay.py config_file world_spec_file recording_file
+
+The config and world specification files should be the ones the recording
+was made with. While it plays:
+    Space                 pause or carry on playing
+    Left, Right           go back or forward one frame
+    Page Up, Page Down    go back or forward ten seconds
+    Home, End             go to the start or end of the recording
+    1, 2, 3, 4            play 1, 10, 100 or 1000 frames per frame shown
+    +, -                  double or halve the number of frames per frame shown
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import sys
+
+#imports from our own files
+from main import *
+from recording import *
+
+def run_replay(replay, config):
+    """ Play back a Replay in the Pygame window. Only returns when the
+    user closes the window. """
+    clock = pygame.time.Clock()
+    playing = True
+    speed = 1
+    shown_world = None
+    replay.seek(replay.first_frame)
+
+    while True:
+        clock.tick(config.framerate)
+
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                return
+            elif event.type != KEYDOWN:
+                continue
+
+            if event.key == K_SPACE:
+                playing = not playing
+            elif event.key == K_LEFT:
+                replay.seek(replay.frame - 1)
+            elif event.key == K_RIGHT:
+                replay.seek(replay.frame + 1)
+            elif event.key == K_PAGEUP:
+                replay.seek(replay.frame - 10*config.framerate)
+            elif event.key == K_PAGEDOWN:
+                replay.seek(replay.frame + 10*config.framerate)
+            elif event.key == K_HOME:
+                replay.seek(replay.first_frame)
+            elif event.key == K_END:
+                replay.seek(replay.last_frame)
+            elif event.key in World.speed_keys:
+                speed = World.speed_keys[event.key]
+            elif event.key in (K_PLUS, K_EQUALS, K_KP_PLUS):
+                speed *= 2
+            elif event.key in (K_MINUS, K_KP_MINUS):
+                speed = max(1, speed//2)
+
+        if playing:
+            if replay.frame < replay.last_frame:
+                replay.seek(replay.frame + speed)
+            else:
+                playing = False
+
+        pygame.display.set_caption("Critters replay: frame {0} of {1} ({2}x speed{3})".format(
+            replay.frame, replay.last_frame, speed, "" if playing else ", paused"))
+
+        # Seeking a long way gives a new World, which has to be drawn in full
+        changed_rects = replay.world.render()
+        if changed_rects == None or replay.world is not shown_world:
+            pygame.display.flip()
+        else:
+            pygame.display.update(changed_rects)
+        shown_world = replay.world
+
+if __name__ == '__main__':
+    cache = AssetCache("cache")
+    try:
+        config = Config(sys.argv[1], sys.argv[2], cache)
+        recording_file = sys.argv[3]
+    except ConfigParseException as ex:
+        print ex
+        sys.exit(1)
+    except IndexError:
+        # User left out a command-line parameter
+        print "USAGE: python replay.py config_file world_spec_file recording_file"
+        sys.exit(1)
+
+    # The replayed graphs shouldn't overwrite the recorded run's exports
+    for setting in Config.setting_dict:
+        if setting.endswith("_export_path") or setting == "telemetry_path":
+            config.override(setting, "")
+
+    pygame.init()
+    pygame.font.init()
+    use_cache(cache)
+
+    if config.enable_graphs:
+        screen = pygame.display.set_mode((config.world_width + config.graph_width, config.world_height))
+    else:
+        screen = pygame.display.set_mode((config.world_width, config.world_height))
+
+    try:
+        replay = Replay(recording_file, screen, config)
+    except (IOError, ValueError) as ex:
+        print ex
+        sys.exit(1)
+    run_replay(replay, config)
+    replay.close()
@@ -0,0 +1,190 @@
+"""
+spatial.py
+
+Contains the spatial hash used to find the objects near a point
+without looking at every object in the world.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+from __future__ import division
+
+from math import *
+
+class SpatialHash(object):
+    """ Buckets Objects into a uniform grid of cells covering the world.
+
+    The grid wraps around in the same way as the world does, so the
+    neighbours of a cell on the right edge include the cells on the left
+    edge. Each cell is at least cell_size wide and high, so everything
+    within cell_size of a point lies in the 3x3 block of cells around it;
+    larger radii are supported, but have to look at more cells.
+
+    Objects must have x and y attributes in [0, width)x[0, height). Call
+    move whenever an object's position changes. """
+
+    # Map from (cols, rows) to the neighbourhoods of a grid of that shape
+    neighbourhood_cache = {}
+
+    def __init__(self, world_width, world_height, cell_size):
+        """ Create an empty SpatialHash for a world of the given size.
+        cell_size - the radius that queries will usually be made with """
+        self.world_width = world_width
+        self.world_height = world_height
+
+        # Fit as many whole cells as we can into the world; the cells are
+        # stretched slightly so that they tile the world exactly.
+        self.cols = max(1, int(world_width // cell_size))
+        self.rows = max(1, int(world_height // cell_size))
+        self.cell_width = world_width / self.cols
+        self.cell_height = world_height / self.rows
+        self.min_cell_size_sq = min(self.cell_width, self.cell_height)**2
+
+        # One list of objects per cell, indexed by row*cols + col
+        self.cells = [[] for i in xrange(self.cols*self.rows)]
+
+        # Map from object to the index of the cell it is currently in
+        self.object_cells = {}
+
+        # For each cell, the indices of the (distinct) cells in the 3x3 block
+        # around it. Precomputed since small worlds have fewer than 3 rows or
+        # columns, and we don't want to visit the same cell twice. The cell
+        # itself comes first, since that's where any_within is most likely
+        # to find something. They only depend on the shape of the grid, so
+        # hashes with the same shape share them.
+        shape = (self.cols, self.rows)
+        if shape not in SpatialHash.neighbourhood_cache:
+            neighbourhoods = []
+            for row in xrange(self.rows):
+                for col in xrange(self.cols):
+                    neighbourhood = []
+                    for dr in (0, -1, 1):
+                        for dc in (0, -1, 1):
+                            index = ((row + dr) % self.rows)*self.cols + (col + dc) % self.cols
+                            if index not in neighbourhood:
+                                neighbourhood.append(index)
+                    neighbourhoods.append(neighbourhood)
+            SpatialHash.neighbourhood_cache[shape] = neighbourhoods
+        self.neighbourhoods = SpatialHash.neighbourhood_cache[shape]
+
+    def __len__(self):
+        return len(self.object_cells)
+
+    def __contains__(self, obj):
+        return obj in self.object_cells
+
+    def cell_index(self, x, y):
+        """ Find the index of the cell containing the point (x, y). """
+        # The modulo catches floating-point rounding right at the far edge
+        return (int(y / self.cell_height) % self.rows)*self.cols \
+                + int(x / self.cell_width) % self.cols
+
+    def insert(self, obj):
+        """ Start tracking an object. """
+        index = self.cell_index(obj.x, obj.y)
+        self.cells[index].append(obj)
+        self.object_cells[obj] = index
+
+    def remove(self, obj):
+        """ Stop tracking an object. Does nothing if the object isn't tracked. """
+        index = self.object_cells.pop(obj, None)
+        if index != None:
+            self.cells[index].remove(obj)
+
+    def move(self, obj):
+        """ Update the hash after the object's position has changed. """
+        new_index = self.cell_index(obj.x, obj.y)
+        old_index = self.object_cells[obj]
+        if new_index != old_index:
+            self.cells[old_index].remove(obj)
+            self.cells[new_index].append(obj)
+            self.object_cells[obj] = new_index
+
+    def cells_around(self, x, y, radius_sq):
+        """ Find the indices of the cells which could contain objects within
+        sqrt(radius_sq) of (x, y). """
+        index = self.cell_index(x, y)
+        if radius_sq <= self.min_cell_size_sq:
+            return self.neighbourhoods[index]
+
+        # The radius is bigger than a cell, so look further than the 3x3 block.
+        # Don't look further than the whole grid, or we'd visit cells twice.
+        radius = sqrt(radius_sq)
+        col_reach = min(int(ceil(radius / self.cell_width)), self.cols//2)
+        row_reach = min(int(ceil(radius / self.cell_height)), self.rows//2)
+        row = index // self.cols
+        col = index % self.cols
+        indices = [index]
+        seen = set(indices)
+        for dr in xrange(-row_reach, row_reach + 1):
+            for dc in xrange(-col_reach, col_reach + 1):
+                neighbour = ((row + dr) % self.rows)*self.cols + (col + dc) % self.cols
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    indices.append(neighbour)
+        return indices
+
+    def nearby(self, x, y):
+        """ Generate every object in the 3x3 block of cells around (x, y).
+        This is a superset of the objects within cell_size of the point. """
+        cells = self.cells
+        for index in self.neighbourhoods[self.cell_index(x, y)]:
+            for obj in cells[index]:
+                yield obj
+
+    def query(self, x, y, radius_sq, exclude=None):
+        """ Find every object strictly within sqrt(radius_sq) of (x, y).
+
+        Returns a list of triples (obj, dx, dy), where dx and dy give the position
+        of obj relative to (x, y), taking the shorter way around the world.
+        exclude - an object to leave out of the results (usually the object
+                  doing the looking) """
+        width = self.world_width
+        height = self.world_height
+        half_width = width/2
+        half_height = height/2
+        cells = self.cells
+
+        found = []
+        for index in self.cells_around(x, y, radius_sq):
+            for obj in cells[index]:
+                if obj is exclude:
+                    continue
+
+                # There's two different ways to get from x to obj.x: directly,
+                # or around the left/right edge. Take the shorter one.
+                dx = obj.x - x
+                if dx > half_width: dx -= width
+                elif dx < -half_width: dx += width
+
+                # And the same with the y values
+                dy = obj.y - y
+                if dy > half_height: dy -= height
+                elif dy < -half_height: dy += height
+
+                if dx*dx + dy*dy < radius_sq:
+                    found.append((obj, dx, dy))
+        return found
+
+    def any_within(self, x, y, radius_sq, exclude=None):
+        """ Determine whether any object (other than exclude) is strictly within
+        sqrt(radius_sq) of (x, y). Stops looking as soon as one is found. """
+        width = self.world_width
+        height = self.world_height
+        cells = self.cells
+
+        for index in self.cells_around(x, y, radius_sq):
+            for obj in cells[index]:
+                if obj is exclude:
+                    continue
+                dx = abs(obj.x - x)
+                dx = min(dx, width - dx)
+                dy = abs(obj.y - y)
+                dy = min(dy, height - dy)
+                if dx*dx + dy*dy < radius_sq:
+                    return True
+        return False
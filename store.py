@@ -0,0 +1,110 @@
+"""
+store.py
+
+Contains the ObjectStore, which holds the World's objects and gives
+each of them a stable ID.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import itertools
+
+class ObjectStore(object):
+    """ A collection of Objects with constant-time insertion and deletion.
+
+    Objects are kept in a dense list, which is what iteration goes over.
+    Each object added is given a new object_ID, which is never reused, and
+    the store keeps a map from ID to the object's position in the list.
+    Deleting an object moves the last object in the list into its place
+    (so deletion does not preserve the order of the other objects).
+
+    Supports len, iteration, "obj in store" and indexing; slicing returns
+    a plain list, so "store[:]" takes a copy that is safe to iterate over
+    while modifying the store. """
+
+    def __init__(self, id_source=None):
+        """ Create an empty ObjectStore.
+        id_source - iterator giving the IDs to hand out; pass the same one
+                    to several stores to keep IDs unique between them """
+        if id_source == None:
+            id_source = itertools.count()
+        self.id_source = id_source
+        self.objects = []
+
+        # Map from object_ID to the index of the object in self.objects
+        self.indices = {}
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __iter__(self):
+        return iter(self.objects)
+
+    def __getitem__(self, index):
+        return self.objects[index]
+
+    def __contains__(self, obj):
+        index = self.indices.get(getattr(obj, "object_ID", None))
+        return index != None and self.objects[index] is obj
+
+    def add(self, obj):
+        """ Add an object, setting its object_ID attribute to a new ID. """
+        obj.object_ID = next(self.id_source)
+        self.indices[obj.object_ID] = len(self.objects)
+        self.objects.append(obj)
+
+    def add_with_ID(self, obj):
+        """ Add an object which keeps the object_ID it already has (for
+        instance, one restored from a checkpoint). The ID must not belong to
+        anything else in the store, or be handed out by the ID source later. """
+        if obj.object_ID in self.indices:
+            raise ValueError("Object ID {0} is already in use".format(obj.object_ID))
+        self.indices[obj.object_ID] = len(self.objects)
+        self.objects.append(obj)
+
+    def remove(self, obj):
+        """ Remove an object from the store. Raises ValueError if it's not
+        in the store. """
+        if obj not in self:
+            raise ValueError("Object is not in the store")
+        index = self.indices.pop(obj.object_ID)
+
+        # Swap the last object into the hole left by the removed one
+        last = self.objects.pop()
+        if last is not obj:
+            self.objects[index] = last
+            self.indices[last.object_ID] = index
+
+    def get(self, object_ID):
+        """ Find the object with the given ID, or None if there isn't one
+        (for instance, if it has been removed). """
+        index = self.indices.get(object_ID)
+        if index == None:
+            return None
+        return self.objects[index]
+
+    def sort(self, key):
+        """ Sort the objects in place, as with list.sort. """
+        self.objects.sort(key=key)
+        for (index, obj) in enumerate(self.objects):
+            self.indices[obj.object_ID] = index
+
+class IDCounter(object):
+    """ An iterator giving the IDs 0, 1, 2, ..., like itertools.count, except
+    that the next ID can be read and set (so that it can be saved and restored).
+    Pass it to several ObjectStores to keep IDs unique between them. """
+
+    def __init__(self, next_ID=0):
+        self.next_ID = next_ID
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        ID = self.next_ID
+        self.next_ID += 1
+        return ID
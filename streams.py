@@ -0,0 +1,89 @@
+"""
+streams.py
+
+Contains RandomStreams, which gives each World its own reproducible
+random number generators.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import os
+import random
+import hashlib
+import binascii
+
+# NumPy is only needed for the array backend, so don't insist on it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class RandomStreams(object):
+    """ A family of independent random number generators ("streams"), all
+    derived from one seed string. Each stream has a name, and its seed is a
+    SHA-256 hash of the seed string and the name; so the same seed always gives
+    the same streams, in any process and on any platform (unlike seeding with
+    Python's hash()), and the numbers drawn from one stream don't depend on
+    how many were drawn from any other.
+
+    The World uses separate streams for separate purposes (e.g. "behaviour"
+    for the critters' random turns, "birds" for the eagle and dove), so that
+    drawing the screen, for instance, doesn't change what happens in the
+    simulation. """
+
+    def __init__(self, seed=""):
+        """ Create the streams for a seed string. If the seed is empty, a seed
+        is chosen using the OS-specific randomness source; it is kept in
+        self.seed, so the run can be repeated. """
+        if seed == "":
+            seed = binascii.hexlify(os.urandom(16))
+        self.seed = seed
+        self.streams = {}
+        self.numpy_streams = {}
+
+    def digest(self, name):
+        """ Get the hash that the stream called name is seeded from. """
+        return hashlib.sha256(self.seed + "/" + name).digest()
+
+    def stream(self, name):
+        """ Get the stream called name, as a random.Random. """
+        if name not in self.streams:
+            self.streams[name] = random.Random(long(binascii.hexlify(self.digest(name)), 16))
+        return self.streams[name]
+
+    def numpy_stream(self, name):
+        """ Get the stream called name, as a numpy.random.RandomState, for drawing
+        arrays of random numbers at once. (It is not the same stream as the
+        random.Random of the same name.) """
+        if name not in self.numpy_streams:
+            words = numpy.frombuffer(self.digest(name), dtype="<u4")
+            self.numpy_streams[name] = numpy.random.RandomState(words)
+        return self.numpy_streams[name]
+
+    def get_state(self):
+        """ Get the state of every stream used so far, as a picklable object
+        which set_state can restore. """
+        return {"seed": self.seed,
+                "streams": dict((name, stream.getstate())
+                                for (name, stream) in self.streams.items()),
+                "numpy_streams": dict((name, stream.get_state())
+                                      for (name, stream) in self.numpy_streams.items())}
+
+    def set_state(self, state):
+        """ Put the streams back into a state returned by get_state. The
+        streams are changed in place, so anything holding on to one of them
+        sees the restored state too. """
+        self.seed = state["seed"]
+        for (name, stream_state) in state["streams"].items():
+            self.stream(name).setstate(stream_state)
+        for (name, stream_state) in state["numpy_streams"].items():
+            self.numpy_stream(name).set_state(stream_state)
+
+def seed_from_string(seed):
+    """ Turn a seed string into an integer suitable for random.seed, which
+    is the same in every process (unlike hash(seed)). """
+    return long(binascii.hexlify(hashlib.sha256(seed).digest()), 16)
@@ -0,0 +1,236 @@
+"""
+telemetry.py
+
+Contains the TelemetrySink, which collects samples of the graphs' data
+(and any other metrics) during a run and writes them to a file in the
+background, so that the simulation doesn't wait for the disk.
+
+Michael Davies and David Shorten
+CSC3003S Capstone Project
+
+All graphics used in this program are open content and
+were provided for by REFMAP(http://www.tekepon.net/fsm)
+"""
+
+import os
+import sys
+import time
+import errno
+import array
+import struct
+import threading
+from os import path
+
+# Written at the start of binary telemetry files; change the number when
+# the format changes
+telemetry_magic = "Critters telemetry 1\n"
+
+# Binary telemetry files are a series of records, each starting with its
+# type ("N" for a metric name, "S" for a batch of samples) and its length
+# (the length of the name, or the number of samples)
+record_header = struct.Struct("<cI")
+
+# File extension for each format
+telemetry_extensions = {"csv": ".csv", "binary": ".telemetry"}
+
+class TelemetrySink(object):
+    """ Collects samples of named metrics, and writes them to one table per
+    run, with a row per sample: the frame it was taken on, the time (in
+    seconds since the sink was created), the name of the metric and its value.
+
+    record only puts the sample into a ring buffer, which is allocated up
+    front; a background thread takes everything in the buffer whenever it's
+    half full (or every flush_interval seconds) and writes it out. If the
+    buffer fills up before the thread has emptied it, record waits for it.
+
+    The table is written either as CSV, or in a binary format with the
+    values of each batch packed into columns (see read_binary_telemetry). """
+
+    def __init__(self, directory, file_format="csv", capacity=8192, flush_interval=1.0):
+        """ Create a sink writing a new table in the given directory (which
+        is created if necessary), named after the current date and time.
+        file_format - "csv" or "binary"
+        capacity - number of samples the buffer can hold """
+        if file_format not in telemetry_extensions:
+            raise ValueError("Unknown telemetry format: {0}".format(file_format))
+        self.file_format = file_format
+        self.capacity = capacity
+        self.batch_size = capacity//2
+        self.flush_interval = flush_interval
+        self.start_time = time.time()
+
+        # The ring buffer, as one array per column. head is the number of
+        # samples recorded so far and tail the number taken by the writer,
+        # so sample number i is at index i % capacity.
+        self.frames = array.array("i", [0])*capacity
+        self.times = array.array("d", [0.0])*capacity
+        self.metrics = array.array("i", [0])*capacity
+        self.values = array.array("d", [0.0])*capacity
+        self.head = 0
+        self.tail = 0
+
+        # Metric names, in the order they were first recorded (samples refer
+        # to them by index), and the number of them written out so far
+        self.metric_names = []
+        self.metric_indices = {}
+        self.names_written = 0
+
+        self.filename = unique_filename(directory, time.strftime(
+            "run-%Y%m%d-%H%M%S", time.localtime(self.start_time)),
+            telemetry_extensions[file_format])
+        self.out = open(self.filename, "wb")
+        if file_format == "csv":
+            self.out.write("frame,time,metric,value\n")
+        else:
+            self.out.write(telemetry_magic + struct.pack("<d", self.start_time))
+
+        # Guards everything above which both threads use
+        self.lock = threading.Condition()
+        self.closed = False
+
+        self.thread = threading.Thread(target=self.run_writer, name="TelemetrySink writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, metric, frame, value):
+        """ Record a sample of a metric (given by name), taken on the given frame. """
+        with self.lock:
+            index = self.metric_indices.get(metric)
+            if index == None:
+                index = len(self.metric_names)
+                self.metric_names.append(metric)
+                self.metric_indices[metric] = index
+
+            while self.head - self.tail == self.capacity:
+                self.lock.notify()
+                self.lock.wait()
+
+            position = self.head % self.capacity
+            self.frames[position] = frame
+            self.times[position] = time.time() - self.start_time
+            self.metrics[position] = index
+            self.values[position] = value
+            self.head += 1
+            if self.head - self.tail == self.batch_size:
+                self.lock.notify()
+
+    def close(self):
+        """ Write out everything recorded, and close the file. """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.lock.notify()
+        self.thread.join()
+        self.out.close()
+
+    def run_writer(self):
+        """ The background thread: wait for samples, and write them out. """
+        while True:
+            with self.lock:
+                if not self.closed and self.head - self.tail < self.batch_size:
+                    self.lock.wait(self.flush_interval)
+                batch = self.take_batch()
+                new_names = self.metric_names[self.names_written:]
+                self.names_written = len(self.metric_names)
+                names = list(self.metric_names)
+                finished = self.closed
+
+                # record may be waiting for room in the buffer
+                self.lock.notify()
+
+            if self.file_format == "csv":
+                self.write_csv(batch, names)
+            else:
+                self.write_binary(batch, new_names)
+            self.out.flush()
+
+            if finished:
+                return
+
+    def take_batch(self):
+        """ Take every sample out of the buffer, as a tuple of arrays (frames,
+        times, metrics, values). Must be called with the lock held. """
+        start = self.tail % self.capacity
+        end = start + (self.head - self.tail)
+        self.tail = self.head
+        batch = []
+        for column in (self.frames, self.times, self.metrics, self.values):
+            if end <= self.capacity:
+                batch.append(column[start:end])
+            else:
+                batch.append(column[start:] + column[:end - self.capacity])
+        return tuple(batch)
+
+    def write_csv(self, batch, names):
+        (frames, times, metrics, values) = batch
+        self.out.write("".join("{0},{1:.4f},{2},{3:.15g}\n".format(
+                                   frame, sample_time, names[metric], value)
+                               for (frame, sample_time, metric, value)
+                                   in zip(frames, times, metrics, values)))
+
+    def write_binary(self, batch, new_names):
+        for name in new_names:
+            self.out.write(record_header.pack("N", len(name)) + name)
+        (frames, times, metrics, values) = batch
+        if len(frames) == 0:
+            return
+        self.out.write(record_header.pack("S", len(frames)))
+        for column in batch:
+            # Always stored little-endian
+            if sys.byteorder != "little":
+                column.byteswap()
+            self.out.write(column.tostring())
+
+def read_binary_telemetry(filename):
+    """ Read a binary telemetry file. Returns a tuple (start time, rows),
+    where the start time is as given by time.time() and rows is a list of
+    tuples (frame, time, metric name, value), as in the CSV format. """
+    rows = []
+    names = []
+    with open(filename, "rb") as in_file:
+        if in_file.read(len(telemetry_magic)) != telemetry_magic:
+            raise ValueError("Not a telemetry file, or from a different version")
+        (start_time,) = struct.unpack("<d", in_file.read(8))
+        while True:
+            header = in_file.read(record_header.size)
+            if len(header) < record_header.size:
+                break
+            (record_type, length) = record_header.unpack(header)
+            if record_type == "N":
+                names.append(in_file.read(length))
+                continue
+
+            columns = []
+            for typecode in ("i", "d", "i", "d"):
+                column = array.array(typecode)
+                column.fromstring(in_file.read(length*column.itemsize))
+                if sys.byteorder != "little":
+                    column.byteswap()
+                columns.append(column)
+            (frames, times, metrics, values) = columns
+            rows.extend((frame, sample_time, names[metric], value)
+                        for (frame, sample_time, metric, value)
+                            in zip(frames, times, metrics, values))
+    return (start_time, rows)
+
+def unique_filename(directory, name, extension):
+    """ Create a new, empty file in directory called name + extension, or
+    name-2 + extension and so on if that exists already; return its path. """
+    if not path.isdir(directory):
+        os.makedirs(directory)
+    number = 1
+    while True:
+        if number == 1:
+            filename = path.join(directory, name + extension)
+        else:
+            filename = path.join(directory, "{0}-{1}{2}".format(name, number, extension))
+        try:
+            # Fails if the file exists, even if another process is
+            # creating the same file at the same moment
+            os.close(os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return filename
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+            number += 1